@@ -1,4 +1,5 @@
 from digitalTwin_Simulation import Simulation
+from digitalTwin_SaveFile import Autosave
 from digitalTwin_Entities import *
 
 from tkinter import Tk
@@ -44,6 +45,7 @@ class PLC1(PLC):
         self.plc_order_trigger = 0
         
         # -- PLC internal Vars --
+        # requested Stacks, counted down by the Trigger exits below (not by ticks, nothing to schedule)
         self._sim_conveyer1._req_count = 0
         self._sim_conveyer2._req_count = 0
         
@@ -323,7 +325,24 @@ class PLC3b(PLC):
         self.status.update()
 
 
+def create_plant(world:World) -> list[PLC]:
+    """Builds the Module 1 - Module 3b layout (OPC UA endpoints on port 7000-7003)"""
+    plc1 = PLC1(parent=world, pos=Vector(20, 100), endpoint="opc.tcp://localhost:7000", name="Module 1")
+    plc2 = PLC2(parent=world, pos=Vector(300, 100), endpoint="opc.tcp://localhost:7001", name="Module 2")
+    plc3a = PLC3a(parent=world, pos=Vector(580, 20), endpoint="opc.tcp://localhost:7002", name="Module 3a")
+    plc3b = PLC3b(parent=world, pos=Vector(580, 350), endpoint="opc.tcp://localhost:7003", name="Module 3b")
+    return [plc1, plc2, plc3a, plc3b]
+
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Digital twin of the Module 1 - Module 3b plant")
+    parser.add_argument("--shared-opc", metavar="ENDPOINT", help="host all modules in one OPC UA server instead of port 7000-7003, e.g. opc.tcp://localhost:4840")
+    parser.add_argument("--autosave", metavar="DIR", help="write checkpoints to DIR in the background")
+    parser.add_argument("--autosave-interval", type=float, default=60.0, help="seconds between two checkpoints")
+    args = parser.parse_args()
+    PLC_OPCua.SHARED_ENDPOINT = args.shared_opc
+    
     root = Tk()
     root.rowconfigure(0, weight=1)
     root.columnconfigure(0, weight=1)
@@ -332,14 +351,18 @@ if __name__ == "__main__":
     sim = Simulation(master=root)
     sim.grid(row=0, column=0, sticky="NSEW")
     
-    plc1 = PLC1(parent=sim.world, pos=Vector(20, 100), endpoint="opc.tcp://localhost:7000", name="Module 1")
-    plc2 = PLC2(parent=sim.world, pos=Vector(300, 100), endpoint="opc.tcp://localhost:7001", name="Module 2")
-    plc3a = PLC3a(parent=sim.world, pos=Vector(580, 20), endpoint="opc.tcp://localhost:7002", name="Module 3a")
-    plc3a = PLC3b(parent=sim.world, pos=Vector(580, 350), endpoint="opc.tcp://localhost:7003", name="Module 3b")
+    create_plant(sim.world)
+    if args.autosave:
+        sim.autosave = Autosave(sim.world, args.autosave, interval=args.autosave_interval)
     
     sim.start()
-        
-    root.protocol("WM_DELETE_WINDOW", lambda: sim.clear() or root.destroy())
+    
+    def close():
+        if sim.autosave:
+            sim.autosave.stop()
+        sim.clear()
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", close)
         
     # animation()
     root.mainloop()
@@ -2,33 +2,32 @@ from asyncua.sync import Server, ThreadLoop
 from asyncua import ua
 
 class PLC_OPCua:
+    """
+    Handshake tags of one module
+    Outputs (Ack, Busy, Ready, Msg) are only written when they changed, for all modules in one hop into the
+    ThreadLoop per cycle (flush_outputs). Inputs (Start, Order) are pushed by data change callbacks of the
+    address space, reading them costs nothing.
+    
+    By default every module runs its own server on its own endpoint (ns=2;s="Start" ...).
+    With PLC_OPCua.SHARED_ENDPOINT set (before the first module is created) all modules share one server:
+    every module gets the namespace "PLC_OPC/<name>" and a folder <name> holding its Handshake object,
+    the nodes are ns=<namespace index>;s="Start" ... and the endpoint argument is ignored.
+    
+    With PLC_OPCua.ENABLED = False no server is created at all, the handshake runs on set_input()
+    (e.g. many headless simulations side by side, see digitalTwin_Sweep).
+    """
     instances = list()
     TLOOP = None
+    ENABLED:bool = True
+    SHARED_ENDPOINT:str = None  # e.g. "opc.tcp://localhost:4840"
+    _shared_server:Server = None
+    _pending_writes:list = list()  # (server, nodeid, DataValue) of all modules, written by flush_outputs
     
     def __init__(self, name:str, endpoint:str="opc.tcp://localhost:7000"):
-        if not PLC_OPCua.TLOOP:
-            PLC_OPCua.TLOOP = ThreadLoop()
-            PLC_OPCua.TLOOP.start()
-        self._server = Server(tloop=PLC_OPCua.TLOOP)
-        self._server.set_security_policy([
-                        ua.SecurityPolicyType.NoSecurity,
-                        ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
-                        ua.SecurityPolicyType.Basic256Sha256_Sign])
-        self._server.set_server_name(name)
-        self._server.set_endpoint(endpoint)
-        self._server.register_namespace("PLC_OPC")
-        hs = self._server.nodes.objects.add_object('ns=2;s="HS"', "Handshake")
-        
-        self._start = hs.add_variable('ns=2;s="Start"', "start", False)
-        self._ack = hs.add_variable('ns=2;s="Ack"', "ack", False)
-        self._busy = hs.add_variable('ns=2;s="Busy"', "busy", False)
-        self._ready = hs.add_variable('ns=2;s="Ready"', "ready", False)
-        
-        self._order = hs.add_variable('ns=2;s="Order"', "order", 0)
-        self._msg = hs.add_variable('ns=2;s="Msg"', "msg", 0)
-        
-        self._start.set_writable()
-        self._order.set_writable()
+        self._server:Server = None
+        self._shared:bool = False
+        self._written:dict = dict()  # last values written to the server
+        self._inputs:dict = {"start": False, "order": 0}  # kept up to date by the data change callbacks
         
         self._state:int = 0
 
@@ -40,26 +39,108 @@ class PLC_OPCua:
         self.busy:bool = False
         self.ready:bool = False
         
-        self._server.start()
+        if PLC_OPCua.ENABLED:
+            self._init_server(name, endpoint)
         PLC_OPCua.instances.append(self)
+    
+    def _init_server(self, name:str, endpoint:str):
+        if not PLC_OPCua.TLOOP:
+            PLC_OPCua.TLOOP = ThreadLoop()
+            PLC_OPCua.TLOOP.start()
+        
+        self._shared = bool(PLC_OPCua.SHARED_ENDPOINT)
+        if self._shared:
+            if PLC_OPCua._shared_server is None:
+                PLC_OPCua._shared_server = PLC_OPCua._create_server("DigitalTwin", PLC_OPCua.SHARED_ENDPOINT)
+                PLC_OPCua._shared_server.start()
+            self._server = PLC_OPCua._shared_server
+            ns = self._server.register_namespace(f"PLC_OPC/{name}")
+            self._root = self._server.nodes.objects.add_folder(f'ns={ns};s="{name}"', name)
+        else:
+            self._server = PLC_OPCua._create_server(name, endpoint)
+            ns = self._server.register_namespace("PLC_OPC")  # 2
+            self._root = self._server.nodes.objects
+        hs = self._root.add_object(f'ns={ns};s="HS"', "Handshake")
+        
+        self._start = hs.add_variable(f'ns={ns};s="Start"', "start", False)
+        self._ack = hs.add_variable(f'ns={ns};s="Ack"', "ack", False)
+        self._busy = hs.add_variable(f'ns={ns};s="Busy"', "busy", False)
+        self._ready = hs.add_variable(f'ns={ns};s="Ready"', "ready", False)
+        
+        self._order = hs.add_variable(f'ns={ns};s="Order"', "order", 0)
+        self._msg = hs.add_variable(f'ns={ns};s="Msg"', "msg", 0)
+        
+        self._start.set_writable()
+        self._order.set_writable()
+        
+        self._output_nodes = {"ack": self._ack, "busy": self._busy, "ready": self._ready, "msg": self._msg}
+        self._variant_types = {k: self._server.aio_obj.read_attribute_value(v.nodeid).Value.VariantType for k, v in self._output_nodes.items()}
+        
+        aspace = self._server.aio_obj.iserver.aspace
+        self._callback_handles = [aspace.add_datachange_callback(node.nodeid, ua.AttributeIds.Value, self._input_callback(key))[1] 
+                                  for key, node in (("start", self._start), ("order", self._order))]
+        
+        if not self._shared:
+            self._server.start()
+    
+    @staticmethod
+    def _create_server(name:str, endpoint:str) -> Server:
+        server = Server(tloop=PLC_OPCua.TLOOP)
+        server.set_security_policy([
+                        ua.SecurityPolicyType.NoSecurity,
+                        ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
+                        ua.SecurityPolicyType.Basic256Sha256_Sign])
+        server.set_server_name(name)
+        server.set_endpoint(endpoint)
+        return server
+        
+    def _input_callback(self, key:str):
+        async def callback(handle, datavalue:ua.DataValue):  # runs in the ThreadLoop
+            self._inputs[key] = datavalue.Value.Value
+        return callback
+    
+    def _outputs(self) -> dict:
+        return {"ack": self.ack, "busy": self.busy, "ready": self.ready, "msg": self.msg}
         
     def update_opc(self):
-        self._ack.set_value(self.ack)
-        self._busy.set_value(self.busy)
-        self._ready.set_value(self.ready)
-        self._msg.set_value(self.msg)
+        """Queues the changed outputs (written by PLC_OPCua.flush_outputs) and runs the handshake"""
+        for key, value in self._outputs().items():
+            if key not in self._written or self._written[key] != value:
+                self._written[key] = value
+                if self._server is None:
+                    continue
+                datavalue = ua.DataValue(ua.Variant(value, self._variant_types[key]))
+                PLC_OPCua._pending_writes.append((self._server.aio_obj, self._output_nodes[key].nodeid, datavalue))
         
-        self.start = self._start.get_value()
+        self.start = self._inputs["start"]
         
         self._handshake()
     
+    @staticmethod
+    def flush_outputs():
+        """Writes the queued outputs of all modules in one hop into the ThreadLoop"""
+        if not PLC_OPCua._pending_writes:
+            return
+        writes, PLC_OPCua._pending_writes = PLC_OPCua._pending_writes, list()
+        
+        async def write():
+            for server, nodeid, datavalue in writes:
+                await server.write_attribute_value(nodeid, datavalue)
+        PLC_OPCua.TLOOP.post(write())
+    
+    def has_new_input(self) -> bool:
+        """True if the next update_opc would change something, peeks at the inputs without running the handshake"""
+        if self._inputs["start"] != self.start or any([self._written.get(k) != v for k, v in self._outputs().items()]):
+            return True
+        return bool(self._state) and self._inputs["order"] == 11
+    
     def _handshake(self):
-        if self._order.get_value() == 11:  # Reset handshake without Start
+        if self._inputs["order"] == 11:  # Reset handshake without Start
             self._state = 0
             
         if self.start and not self.busy and self.ready and not self._state:
             self.ack = True
-            self.order = self._order.get_value()
+            self.order = self._inputs["order"]
             self.busy = True
             self._state = 1
             
@@ -71,10 +152,26 @@ class PLC_OPCua:
             self._state = 0
             self.order = 0
         
+    def set_input(self, key:str, value):
+        """Writes Start ("start") or Order ("order") like an OPC UA client would"""
+        if self._server is None:
+            self._inputs[key] = value
+        else:
+            {"start": self._start, "order": self._order}[key].set_value(value)
+        
     def remove(self):
-        self._server.stop()  # check if this has to be moved to __del__
+        if self._server is not None:
+            aspace = self._server.aio_obj.iserver.aspace
+            [aspace.delete_datachange_callback(x) for x in self._callback_handles]
+            if self._shared:
+                self._root.delete(recursive=True)  # the other modules keep the server
+            else:
+                self._server.stop()  # check if this has to be moved to __del__
         PLC_OPCua.instances.remove(self)
-        if not PLC_OPCua.instances:  # shut down shared Async thread
+        if self._shared and not any([x._shared for x in PLC_OPCua.instances]):
+            PLC_OPCua._shared_server.stop()
+            PLC_OPCua._shared_server = None
+        if not PLC_OPCua.instances and PLC_OPCua.TLOOP:  # shut down shared Async thread
             PLC_OPCua.TLOOP.stop()  # <-- blocking operation
             PLC_OPCua.TLOOP = None
             
@@ -0,0 +1,414 @@
+"""
+Microbenchmarks for digitalTwin_base, they run without a display
+
+    python digitalTwin_Benchmark.py                         # table
+    python digitalTwin_Benchmark.py --json results.json     # machine readable
+    python digitalTwin_Benchmark.py --compare results.json  # speedup against an earlier run
+    python digitalTwin_Benchmark.py --legacy                # Vector against the former dataclass Vector
+"""
+from digitalTwin_base import Vector, Entity, World, Trigger, TriggerTypes, AABB_Collider, Sphere_Collider, HeadlessRenderBackend, Orientation, collider_helper, EMPTY_SET
+from digitalTwin_Entities import Wall, Stack, Conveyer, Stopper, Sensor, Picker, PLC_OPCua
+
+from dataclasses import dataclass
+import contextlib
+import gc
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import timeit
+
+
+@dataclass
+class LegacyVector:
+    """The former dataclass Vector (only the parts used by the call sites below), kept as reference"""
+    x:float
+    y:float
+    
+    _length = None
+    
+    def __post_init__(self):
+        pass
+    
+    def __add__(self, other) -> "LegacyVector":
+        return LegacyVector(self.x + other.x, self.y + other.y)
+    
+    def __sub__(self, other) -> "LegacyVector":
+        return LegacyVector(self.x - other.x, self.y - other.y)
+    
+    @property
+    def length(self) -> float:
+        if self._length is None:
+            self._length = math.sqrt(self.x**2 + self.y**2)
+        return self._length
+    
+    def __mul__(self, other):
+        if type(other) in [int, float]:
+            return LegacyVector(self.x * other, self.y * other)
+        if isinstance(other, LegacyVector):
+            return self.x * other.x + self.y * other.y
+    
+    def norm_box(self, size:"LegacyVector") -> tuple["LegacyVector", "LegacyVector"]:
+        size = self + size
+        pos1 = LegacyVector(x=min(self.x, size.x), y=min(self.y, size.y))
+        pos2 = LegacyVector(x=max(self.x, size.x), y=max(self.y, size.y))
+        return pos1, pos2-pos1
+
+
+def timed(func, number:int=100000, repeat:int=5) -> float:
+    """Best of repeat runs in ns per call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def vector_call_sites(cls) -> dict[str, "function"]:
+    """The Vector patterns of the hot call sites, for a Vector implementation cls"""
+    parent_abs, pos, move = cls(120.0, 80.0), cls(13.0, 13.0), cls(1.0, 0.0)
+    box_pos, box_size = cls(3.0, 3.0), cls(-20.0, 20.0)
+    other_abs = cls(131.0, 95.0)
+    
+    def update_abs_pos():  # Entity._update_abs_pos, collider abs_pos
+        abs_pos = parent_abs + pos
+        return abs_pos + pos
+    
+    def stack_move():  # Stack.move: move, check, revert
+        new_pos = pos + move
+        return parent_abs + new_pos, parent_abs + pos
+    
+    if hasattr(cls, "distance_sq"):
+        def sphere_check():  # Sphere_Collider in Sphere_Collider
+            return parent_abs.distance_sq(other_abs) < 19 * 19
+    else:
+        def sphere_check():
+            return (parent_abs - other_abs).length < 19
+    
+    def conveyer_move_vector():  # Conveyer.speed, animations
+        return move * 2
+    
+    def norm_box():  # RenderContainer.create_*, AABB_Collider.get_box
+        return box_pos.norm_box(box_size)
+    
+    return {"update_abs_pos": update_abs_pos,
+            "stack_move": stack_move,
+            "sphere_check": sphere_check,
+            "conveyer_move_vector": conveyer_move_vector,
+            "norm_box": norm_box}
+
+
+def bench_vector(number:int=100000) -> list[dict]:
+    legacy = vector_call_sites(LegacyVector)
+    current = vector_call_sites(Vector)
+    results = list()
+    for name in current:
+        t_legacy = timed(legacy[name], number=number)
+        t_current = timed(current[name], number=number)
+        results.append({"name": name, "legacy_ns": t_legacy, "current_ns": t_current, "speedup": t_legacy / t_current})
+    return results
+
+
+def measure(name:str, func, repeat:int=5, **params) -> dict:
+    """Best and median of repeat runs in ns per call, the number of calls per run is picked by timeit"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [x / number * 1e9 for x in timer.repeat(repeat=repeat, number=number)]
+    return {"name": name, "params": params, "best_ns": min(runs), "median_ns": statistics.median(runs), "number": number}
+
+
+def new_world() -> World:
+    """Empty headless World, the Entities of the previous one are removed"""
+    if World.instance is not None:
+        [x.remove() for x in list(World.instance.children)]
+    World.events, World.updates, World.renders = list(), set(), set()
+    return World(backend=HeadlessRenderBackend())
+
+
+def bench_vector_ops(repeat:int) -> list[dict]:
+    a, b = Vector(120.0, 80.0), Vector(13.0, 17.0)
+    results = [measure("vector.add", lambda: a + b, repeat),
+               measure("vector.sub", lambda: a - b, repeat),
+               measure("vector.mul_scalar", lambda: a * 2.0, repeat),
+               measure("vector.dot", lambda: a * b, repeat),
+               measure("vector.length", lambda: Vector(3.0, 4.0).length, repeat),
+               measure("vector.rotate", lambda: a.rotate(math.pi/2), repeat),
+               measure("vector.norm_box", lambda: a.norm_box(Vector(-20.0, 20.0)), repeat)]
+    for name, func in vector_call_sites(Vector).items():
+        results.append(measure(f"vector.site.{name}", func, repeat))
+    return results
+
+
+def bench_colliders(repeat:int) -> list[dict]:
+    world = new_world()
+    wall = Wall(world, pos=Vector(100, 100), size=Vector(40, 20))
+    other_wall = Wall(world, pos=Vector(130, 110), size=Vector(40, 20))
+    stack = Stack(world, pos=Vector(95, 110))
+    other_stack = Stack(world, pos=Vector(80, 110))
+    aabb, other_aabb = wall.colliders[0], other_wall.colliders[0]
+    sphere, other_sphere = stack.colliders[0], other_stack.colliders[0]
+    return [measure("collider.aabb_in_aabb", lambda: aabb in other_aabb, repeat),
+            measure("collider.sphere_in_aabb", lambda: sphere in aabb, repeat),
+            measure("collider.sphere_in_sphere", lambda: sphere in other_sphere, repeat),
+            measure("collider.helper", lambda: collider_helper(sphere, aabb), repeat),
+            measure("collider.entity_in_entity", lambda: stack in wall, repeat)]
+
+
+def _stack_field(world:World, n:int, spacing:float=20) -> list[Stack]:
+    columns = max(int(math.sqrt(n)), 1)
+    return [Stack(world, pos=Vector(20 + (i % columns) * spacing, 20 + (i // columns) * spacing)) for i in range(n)]
+
+
+def bench_trigger(repeat:int, sizes=(10, 100, 1000)) -> list[dict]:
+    results = list()
+    for n in sizes:
+        world = new_world()
+        stacks = _stack_field(world, n)
+        extent = stacks[-1].pos
+        # a trigger covering about half of the field, every check queues PRESENT events
+        trigger = Trigger(world.children[0], collider=AABB_Collider(world.children[0], pos=Vector(0, 0), size=extent * 0.5), 
+                          check_group=World.layers[0], check_types=(Stack,))
+        trigger.register(TriggerTypes.PRESENT, lambda e: None)
+        
+        def check():
+            trigger.check()
+            World.events.clear()
+        results.append(measure("trigger.check", check, repeat, entities=n))
+        
+        batched = Trigger(world.children[0], collider=trigger.collider, check_group=World.layers[0], check_types=(Stack,))
+        batched.register_batch(lambda present, enter, exit: None)
+        
+        def check_batch():
+            batched.check()
+            World.events.clear()
+        results.append(measure("trigger.check_batch", check_batch, repeat, entities=n))
+        batched.remove()
+        
+        def check_all():
+            Trigger.check_all()
+            World.events.clear()
+        for vectorized in (False, True):
+            Trigger.vectorized = vectorized
+            results.append(measure("trigger.check_all", check_all, repeat, entities=n, triggers=len(Trigger.instances), vectorized=vectorized))
+        Trigger.vectorized = False
+    return results
+
+
+def bench_stack_move(repeat:int, sizes=(100, 1000)) -> list[dict]:
+    results = list()
+    for n in sizes:
+        world = new_world()
+        stacks = _stack_field(world, n, spacing=19)  # touching neighbours, every move needs collision checks
+        stack = stacks[len(stacks) // 2]
+        forward, back = Vector(0.5, 0), Vector(-0.5, 0)
+        
+        def move():
+            stack.move(forward)
+            stack.move(back)
+        results.append(measure("stack.move", move, repeat, entities=n, moves_per_call=2))
+    return results
+
+
+def bench_conveyer(repeat:int, sizes=(10, 100, 500)) -> list[dict]:
+    results = list()
+    for n in sizes:
+        for lane in (False, True):
+            world = new_world()
+            conveyer = Conveyer(world, pos=Vector(0, 0), length=n * 25 + 100, speed=1, lane=lane)
+            [Stack(world, pos=Vector(50 + i * 25, 10)) for i in range(n)]  # free to move, no neighbour in reach
+            Trigger.check_all()
+            World.events.clear()
+            present = conveyer.triggers[0]._present_entities
+            conveyer._trigger_present_move(present, present, EMPTY_SET)  # fills the lane
+            
+            def move():
+                conveyer.speed = -conveyer.speed  # back and forth, the Stacks stay on the belt
+                conveyer._trigger_present_move(present, EMPTY_SET, EMPTY_SET)
+            results.append(measure("conveyer.move", move, repeat, stacks=n, lane=lane))
+    return results
+
+
+def bench_abs_pos(repeat:int, depths=(10, 100)) -> list[dict]:
+    results = list()
+    world = new_world()
+    for depth in depths:
+        root = entity = Entity(world, pos=Vector(10, 10))
+        for _ in range(depth):
+            entity = Entity(entity, pos=Vector(1, 1))
+        leaf = entity
+        a, b = Vector(10, 10), Vector(11, 10)
+        
+        def move_root():
+            root.pos = b if root.pos is a else a
+            return leaf.abs_pos
+        results.append(measure("entity.update_abs_pos", move_root, repeat, depth=depth))
+        root.remove()
+    
+    # Picker._sled_animation: the Head moves with a picked Stack
+    picker = Picker(world, pos=Vector(100, 100), length=200)
+    stack = Stack(world, pos=Vector(107, 110))
+    Trigger.check_all()
+    World.events.clear()
+    picker.pick_up()
+    head = picker._animation_obj
+    a, b = head.pos, head.pos + Vector(1, 0)
+    
+    def move_head():
+        head.pos = b if head.pos is a else a
+        return [x.abs_pos for x in stack.colliders]
+    results.append(measure("picker.head_move", move_head, repeat, picked=stack in head.children))
+    new_world()
+    return results
+
+
+def _save_layout(world:World, modules:int):
+    # flat top level Entities: save and load cost grow with the number of modules and nothing is rebuilt on load,
+    # the numbers stay comparable with --json files of earlier runs (bench_save_load_plant measures a real layout)
+    for i in range(modules):
+        x, y = (i % 5) * 250, (i // 5) * 250
+        Conveyer(world, pos=Vector(x, y + 100), length=200, speed=1, orientation=Orientation.EAST)
+        Wall(world, pos=Vector(x + 200, y + 100), size=Vector(3, 20))
+        Stopper(world, pos=Vector(x + 100, y + 80), orientation=Orientation.EAST)
+        Sensor(world, pos=Vector(x + 60, y + 85), orientation=Orientation.EAST)
+        for j in range(5):
+            Stack(world, pos=Vector(x + 20 + j * 25, y + 110)).dont_save = False
+
+
+def bench_save_load(repeat:int, sizes=(1, 10)) -> list[dict]:
+    from digitalTwin_Simulation import SaveFileEncoder
+    from digitalTwin_SaveFile import BinarySaveWriter, BinarySaveReader
+    results = list()
+    for modules in sizes:
+        world = new_world()
+        _save_layout(world, modules)
+        save_data = json.loads(json.dumps(world.save(), cls=SaveFileEncoder))
+        entities = len(World.layers[0])
+        
+        def save():
+            return json.dumps(world.save(), cls=SaveFileEncoder)
+        results.append(measure("world.save", save, repeat, modules=modules, entities=entities))
+        
+        def round_trip():
+            [x.remove() for x in list(world.children)]
+            world.load(json.loads(json.dumps(save_data)))
+        results.append(measure("world.save_load_round_trip", round_trip, repeat, modules=modules, entities=entities))
+        
+        def save_binary():
+            BinarySaveWriter(io.BytesIO()).write_world(world)
+        results.append(measure("world.save_binary", save_binary, repeat, modules=modules, entities=entities))
+        
+        def round_trip_binary():
+            f = io.BytesIO()
+            BinarySaveWriter(f).write_world(world)
+            [x.remove() for x in list(world.children)]
+            f.seek(0)
+            BinarySaveReader(f).read_world(world)
+            for x in world.children:  # Stacks are dont_save by default
+                if isinstance(x, Stack):
+                    x.dont_save = False
+        results.append(measure("world.save_load_round_trip_binary", round_trip_binary, repeat, modules=modules, entities=entities))
+    new_world()
+    return results
+
+
+def bench_save_load_plant(repeat:int) -> list[dict]:
+    """The plant of digitalTwin.py: only the PLCs are saved, loading them builds their modules again"""
+    from digitalTwin_Simulation import SaveFileEncoder
+    from digitalTwin_SaveFile import BinarySaveWriter, BinarySaveReader
+    from digitalTwin import create_plant
+    enabled, PLC_OPCua.ENABLED = PLC_OPCua.ENABLED, False  # no OPC UA servers
+    try:
+        world = new_world()
+        create_plant(world)
+        save_data = json.loads(json.dumps(world.save(), cls=SaveFileEncoder))
+        params = {"layout": "plant", "entities": len(world._entities())}
+        
+        def save():
+            return json.dumps(world.save(), cls=SaveFileEncoder)
+        
+        def round_trip():
+            [x.remove() for x in list(world.children)]
+            world.load(json.loads(json.dumps(save_data)))
+        
+        def save_binary():
+            BinarySaveWriter(io.BytesIO()).write_world(world)
+        
+        def round_trip_binary():
+            f = io.BytesIO()
+            BinarySaveWriter(f).write_world(world)
+            [x.remove() for x in list(world.children)]
+            f.seek(0)
+            BinarySaveReader(f).read_world(world)
+        results = [measure("world.save", save, repeat, **params),
+                   measure("world.save_load_round_trip", round_trip, repeat, **params),
+                   measure("world.save_binary", save_binary, repeat, **params),
+                   measure("world.save_load_round_trip_binary", round_trip_binary, repeat, **params)]
+        assert len(world._entities()) == params["entities"]  # a round trip builds every module once
+        new_world()
+    finally:
+        PLC_OPCua.ENABLED = enabled
+    return results
+
+
+SUITES = {"vector": bench_vector_ops,
+          "collider": bench_colliders,
+          "trigger": bench_trigger,
+          "stack_move": bench_stack_move,
+          "conveyer": bench_conveyer,
+          "abs_pos": bench_abs_pos,
+          "save_load": bench_save_load,
+          "save_load_plant": bench_save_load_plant}
+
+
+def run_suite(names=None, repeat:int=5) -> dict:
+    results = list()
+    # Entity.__del__ and friends print, keep stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        for name, suite in SUITES.items():
+            if names and name not in names:
+                continue
+            results += suite(repeat)
+        gc.collect()  # removed Entities live in reference cycles
+    return {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+
+
+def _key(result:dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Microbenchmarks for digitalTwin_base (no display needed)")
+    parser.add_argument("suites", nargs="*", help=f"run only these suites ({', '.join(SUITES)})")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", metavar="PATH", help="write the results to PATH (- for stdout)")
+    parser.add_argument("--compare", metavar="PATH", help="compare against the results of an earlier --json run")
+    parser.add_argument("--legacy", action="store_true", help="only compare Vector against the former dataclass Vector")
+    args = parser.parse_args()
+    unknown = [x for x in args.suites if x not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)} (choose from {', '.join(SUITES)})")
+    
+    if args.legacy:
+        print(f"{'call site':<22}{'legacy ns':>12}{'Vector ns':>12}{'speedup':>10}")
+        for r in bench_vector():
+            print(f"{r['name']:<22}{r['legacy_ns']:>12.0f}{r['current_ns']:>12.0f}{r['speedup']:>9.2f}x")
+        sys.exit()
+    
+    report = run_suite(args.suites, repeat=args.repeat)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=4)
+        sys.exit()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+    
+    baseline = dict()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {_key(x): x for x in json.load(f)["results"]}
+    for r in report["results"]:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        line = f"{r['name']:<34}{params:<42}{r['best_ns']:>14.0f} ns"
+        if _key(r) in baseline:
+            line += f"{baseline[_key(r)]['best_ns'] / r['best_ns']:>9.2f}x"
+        print(line)
@@ -3,7 +3,11 @@ from digitalTwin_base import RenderContainer, AABB_Collider, Sphere_Collider, re
 from digitalTwin_Async_opc import PLC_OPCua
 
 import math
-import tkinter as tk
+
+try:
+    import tkinter as tk
+except ImportError:  # headless installs without Tcl/Tk
+    tk = None
 
 
 DEFAULT_STACK = [{'color': "red"},]
@@ -67,6 +71,7 @@ class Stack(Entity):
         
         self.stack:list[dict] = list(stack)
         self._last_collider_cash = None
+        self._contact:tuple = None  # the blocked move, see is_blocked
         
         self._init_render_containers()
         
@@ -77,17 +82,25 @@ class Stack(Entity):
         
     def change_layer(self, new_layer: int):
         self._last_collider_cash = None
+        self._contact = None
         return super().change_layer(new_layer)
         
     def move(self, vector:Vector, ignore=tuple()) -> bool:
+        if not self.colliders:  # removed by an earlier event of this tick
+            return False
+        if self._contact is not None:
+            if self.is_blocked(vector, ignore):
+                return False  # asleep against the same blocker, the move would collide again
+            self._contact = None
         old_pos = self.pos
         self.pos += vector
         if (self._last_collider_cash and 
             not self._last_collider_cash in ignore and 
             self.collision_check(other=self._last_collider_cash)):
                 self.pos = old_pos  # Movement cancelled
+                self._block(vector, ignore)
                 return False
-        for other in World.layers[self.layer]:
+        for other in World.grid.query(self.layer, *self.get_bounds()):  # only Entities close to the new position
             if other == self:
                 continue
             if other in ignore:
@@ -95,12 +108,37 @@ class Stack(Entity):
             if self.collision_check(other=other):
                 self._last_collider_cash = other
                 self.pos = old_pos  # Movement cancelled
+                self._block(vector, ignore)
                 return False
         self.update()
         return True
     
+    def _block(self, vector:Vector, ignore):
+        blocker = self._last_collider_cash
+        self._contact = (blocker, vector, ignore, self.abs_pos, self.collisions_enabled, len(self.colliders_ignore),
+                         blocker.abs_pos, blocker.collisions_enabled, len(blocker.colliders), len(blocker.colliders_ignore))
+    
+    def is_blocked(self, vector:Vector, ignore=tuple()) -> bool:
+        """
+        True while the last blocked move(vector, ignore) would collide with the same blocker again:
+        neither the Stack nor its blocker moved, opened (collisions_enabled) or lost its colliders (removed)
+        A sleeping Stack costs a few comparisons per tick instead of a move, a revert and a collision query.
+        """
+        contact = self._contact
+        if contact is None or contact[2] is not ignore or vector != contact[1]:
+            return False
+        blocker = contact[0]
+        return (self.abs_pos == contact[3] and self.collisions_enabled == contact[4] and len(self.colliders_ignore) == contact[5]
+                and blocker.abs_pos == contact[6] and blocker.collisions_enabled == contact[7]
+                and len(blocker.colliders) == contact[8] and len(blocker.colliders_ignore) == contact[9]
+                and blocker not in ignore)
+    
     def _update_color(self):
         self.renders[0].set_color(self.stack[-1].get("color", "red"))
+    
+    def _after_restore(self):
+        self._update_color()  # stack_on/unstack may have changed the top
+        Entity._after_restore(self)
         
     def unstack(self) -> "Stack":
         if len(self.stack)-1 or self.infinite_stack:
@@ -119,6 +157,7 @@ class Stack(Entity):
     
     def remove(self):
         self._last_collider_cash = None
+        self._contact = None
         return super().remove()
     
     def __contains__(self, other):
@@ -131,24 +170,30 @@ class Stack(Entity):
 class Conveyer(Entity):
     WIDTH = 20
     add_to_layers = False
+    speed_scale:float = 1  # multiplies the belt speed of all Conveyers (what-if studies, see digitalTwin_Sweep)
     
-    def __init__(self, parent:Entity, pos:Vector, length:float=60, speed:float=1, orientation:Orientation=Orientation.EAST, animated:bool=True):
+    def __init__(self, parent:Entity, pos:Vector, length:float=60, speed:float=1, orientation:Orientation=Orientation.EAST, animated:bool=True, lane:bool=False):
         Entity.__init__(self, parent=parent, pos=pos)
         
         self.orientation:Vector = orientation.value if isinstance(orientation, (Orientation, Vector)) else Vector(*orientation)
         self.length:float = length
         self._speed:float = speed
         self.animated = animated
+        self.lane:bool = lane  # move the Stacks with the 1D lane model, see _lane_move
+        self._lane:list[Stack] = list()  # the present Stacks, front first after a _lane_move
+        self._lane_moved:bool = False  # anything moved in the last _lane_move
         self.ignored_colliders:list[Entity] = list()
         self._animation_conveyer = 0
         self._animation_obj:RenderContainer = None
         self._animation_pos:Vector = None
         
-        self._move_vector = self.orientation * self._speed
+        self._move_vector = self.orientation * (self._speed * Conveyer.speed_scale)
         
         self._init_render_containers()
         if self.animated:
             World.animations.append(self._conveyer_animation)
+            if not self._speed:
+                World.sleep_animation(self._conveyer_animation)
         
         self.update()
         
@@ -158,8 +203,15 @@ class Conveyer(Entity):
     
     @speed.setter
     def speed(self, value):
+        if value != self._speed:
+            World.activity += 1
+            if self.animated:  # the belt line only moves while the belt runs
+                if value:
+                    World.wake_animation(self._conveyer_animation)
+                else:
+                    World.sleep_animation(self._conveyer_animation)
         self._speed = value
-        self._move_vector = self.orientation * value
+        self._move_vector = self.orientation * (value * Conveyer.speed_scale)
         
     def _init_render_containers(self):
         # body
@@ -168,24 +220,131 @@ class Conveyer(Entity):
         RenderContainer.create_rectangle(self, pos=pos, size=size, fill="white")
         # create trigger
         trigger = Trigger(self, collider=AABB_Collider(self, pos=pos, size=size), check_group=World.layers[self.layer], check_types=(Stack,))
-        trigger.register(TriggerTypes.PRESENT, self._trigger_present_move)
+        trigger.register_batch(self._trigger_present_move)
         # line
         pos, size = Vector(-1, -1).norm_box(self.orientation.rotate(math.pi/2) * Conveyer.WIDTH)
         self._animation_obj = RenderContainer.create_line(parent=self, pos=pos, size=size)
         self._animation_pos = pos
         
     def remove(self):
-        if self._conveyer_animation in World.animations:
-            World.animations.remove(self._conveyer_animation)
+        World.remove_animation(self._conveyer_animation)
         Entity.remove(self)
         
     def is_occupied(self) -> bool:
         return self.triggers[0].is_occupied()
+    
+    def is_idle(self) -> bool:
+        # an empty belt only changes the drawing, which only matters with a canvas, Stacks asleep at a blocker don't move
+        if not self._speed:
+            return True
+        if self.animated and World.instance.canvas is not None:
+            return False
+        if self.lane:  # without activity the next _lane_move would move nothing either
+            return not self._lane_moved
+        move_vector, ignore = self._move_vector, self.ignored_colliders
+        return all([x.is_blocked(move_vector, ignore) for x in self.triggers[0]._present_entities if isinstance(x, Stack)])
+        
+    def _trigger_present_move(self, present:set[Stack], enter:set[Stack], exit:set[Stack]):
+        if self.lane:
+            if exit:
+                self._lane[:] = [x for x in self._lane if x not in exit]
+            if enter:
+                self._lane.extend([x for x in enter if isinstance(x, Stack)])
+            if self._speed:
+                self._lane_move()
+            else:
+                self._lane_moved = False
+            return
+        if not self._speed:  # a stopped belt doesn't move anything
+            return
+        move_vector, ignore = self._move_vector, self.ignored_colliders
+        for entity in present:
+            if isinstance(entity, Stack) and entity.colliders:  # not removed by an earlier event of this tick
+                entity.move(move_vector, ignore=ignore)
         
-    def _trigger_present_move(self, entity:Stack):
-        if isinstance(entity, Stack):
-            entity.move(self._move_vector, ignore=self.ignored_colliders)
-        
+    def _lane_blockers(self, box:tuple[Vector, Vector]) -> tuple[list, list]:
+        """
+        The colliders of everything but Stacks that can stop a Stack on the belt: (x1, y1, x2, y2) boxes and (x, y, r) spheres
+        A Stack that overlaps the belt is present, so it is in the lane itself.
+        """
+        boxes, spheres = list(), list()
+        ignore = self.ignored_colliders
+        for other in World.grid.query(self.layer, *box):
+            if isinstance(other, Stack) or not other.collisions_enabled or other in ignore:
+                continue
+            for collider in other.colliders:
+                if type(collider) is AABB_Collider:
+                    b_min, b_max = collider.get_box()
+                    boxes.append((b_min.x, b_min.y, b_max.x, b_max.y))
+                elif type(collider) is Sphere_Collider:
+                    pos = collider.abs_pos
+                    spheres.append((pos.x, pos.y, collider.radius))
+        return boxes, spheres
+    
+    def _lane_move(self):
+        """
+        Moves the Stacks as a 1D lane: sorted by their offset along the running direction, front first, every Stack only
+        checks the Stacks ahead of it within collision range and the blockers of the belt projected into its way.
+        The 2D Stack.move is only used for the hand-offs, Stacks that are not entirely on the belt after the move
+        (entering or leaving), and for Stacks with unusual colliders. Same collision math, no grid query per Stack.
+        """
+        move_vector, ignore = self._move_vector, self.ignored_colliders
+        mx, my = move_vector.x, move_vector.y
+        ox, oy = (self.orientation.x, self.orientation.y) if mx * self.orientation.x + my * self.orientation.y > 0 else (-self.orientation.x, -self.orientation.y)  # the front is where the belt runs to
+        box = self.triggers[0].collider.get_box()
+        x1, y1, x2, y2 = box[0].x, box[0].y, box[1].x, box[1].y
+        
+        lane = self._lane
+        offsets = dict()
+        for stack in lane:
+            pos = stack.abs_pos
+            offsets[stack] = pos.x * ox + pos.y * oy
+        lane.sort(key=offsets.__getitem__, reverse=True)  # nearly sorted already, timsort is linear then
+        boxes, spheres = self._lane_blockers(box)
+        
+        moved = False
+        ahead = list()  # (offset before the move, x, y, radius) of the Stacks already moved this tick
+        for stack in lane:
+            colliders = stack.colliders
+            if not colliders:  # removed by an earlier event of this tick
+                continue
+            sc = colliders[0]
+            pos = sc.abs_pos
+            r = sc.radius
+            nx, ny = pos.x + mx, pos.y + my
+            if (len(colliders) != 1 or type(sc) is not Sphere_Collider or stack.colliders_ignore or not stack.collisions_enabled
+                    or nx - r < x1 or nx + r > x2 or ny - r < y1 or ny + r > y2):
+                moved = stack.move(move_vector, ignore=ignore) or moved  # hand-off
+            elif self._lane_is_free(nx, ny, r, nx * ox + ny * oy, ahead, boxes, spheres):
+                stack.pos += move_vector
+                stack.update()
+                moved = True
+            if stack.collisions_enabled and stack not in ignore:
+                pos = stack.colliders[0].abs_pos if stack.colliders else pos
+                ahead.append((offsets[stack], pos.x, pos.y, r))
+        self._lane_moved = moved
+    
+    @staticmethod
+    def _lane_is_free(x:float, y:float, r:float, offset:float, ahead:list, boxes:list, spheres:list) -> bool:
+        for i in range(len(ahead) - 1, -1, -1):  # closest first
+            other_offset, ox, oy, other_r = ahead[i]
+            radius = r + other_r
+            if other_offset - offset >= radius:  # this one and all further ahead are out of reach
+                break
+            if (ox - x) ** 2 + (oy - y) ** 2 < radius * radius:
+                return False
+        r_sq = r * r
+        for bx1, by1, bx2, by2 in boxes:  # collider_helper
+            dx = bx1 - x if x < bx1 else x - bx2 if x > bx2 else 0
+            dy = by1 - y if y < by1 else y - by2 if y > by2 else 0
+            if dx * dx + dy * dy <= r_sq:
+                return False
+        for sx, sy, sr in spheres:
+            radius = r + sr
+            if (sx - x) ** 2 + (sy - y) ** 2 < radius * radius:
+                return False
+        return True
+    
     def _conveyer_animation(self):
         self._animation_conveyer += self._speed
         if self._animation_conveyer < 0:
@@ -240,10 +399,17 @@ class Stopper(Entity):
             self._animation_stopper = 20
         self._animation_obj.pos = self._animation_pos + self.orientation.value.rotate(math.pi/2) * self._animation_stopper 
         self._animation_obj.render()
+        if self.is_idle():  # open or closed, toggle_stopper wakes it
+            World.sleep_animation(self._stopper_animation)
         
     def remove(self):
-        World.animations.remove(self._stopper_animation)
+        World.remove_animation(self._stopper_animation)
         Entity.remove(self)
+    
+    def is_idle(self) -> bool:
+        if self._animation_speed > 0:
+            return self._animation_stopper == 20
+        return self._animation_stopper == 0 and not self.collisions_enabled
         
     def _trigger_auto_close_stopper(self, *args):
         if self.auto_close or self._close_requested:
@@ -251,6 +417,8 @@ class Stopper(Entity):
     
     def toggle_stopper(self, *args):
         self._animation_speed *= -1
+        World.activity += 1
+        World.wake_animation(self._stopper_animation)
         
     def request_stopper_close(self):
         self._close_requested = True
@@ -269,6 +437,7 @@ class Stopper(Entity):
 @register_entity
 class Spawner(Entity):
     add_to_layers = True
+    save_children = False  # the conveyer is built by __init__
     
     def __init__(self, parent:Entity, pos:Vector, orientation:Orientation=Orientation.EAST, stack=DEFAULT_STACK):
         Entity.__init__(self, parent=parent, pos=pos)
@@ -316,6 +485,7 @@ class Spawner(Entity):
 @register_entity
 class Picker(Entity):
     add_to_layers = False
+    save_children = False  # the head is built by __init__
     
     class Head(Entity):
         def __init__(self, parent:"Picker", pos:Vector, render_head:bool=True):
@@ -362,7 +532,7 @@ class Picker(Entity):
         self.orientation:Vector = orientation.value if isinstance(orientation, (Orientation, Vector)) else Vector(*orientation)
         
         self.sled_actual_pos:int = 0
-        self.sled_target_pos:int = 0
+        self._sled_target_pos:int = 0
         self.sled_max_pos:int = self.length - 20
         self.sled_min_pos:int = 0
         self.sled_in_pos:bool = False
@@ -376,10 +546,26 @@ class Picker(Entity):
         
         self.update()
     
+    @property
+    def sled_target_pos(self) -> int:
+        return self._sled_target_pos
+    
+    @sled_target_pos.setter
+    def sled_target_pos(self, value:int):
+        # wakes the sled even for the same target, the PLCs reset sled_in_pos with every new target
+        self._sled_target_pos = value
+        World.wake_animation(self._sled_animation)
+    
     @property
     def sled_occupied(self):
         return bool(self._animation_obj._picked_stack)
     
+    def is_idle(self) -> bool:
+        target = self.sled_target_pos
+        if self.confine_sled_target_pos:
+            target = min(max(target, self.sled_min_pos), self.sled_max_pos)
+        return self.sled_actual_pos == target
+    
     def pick_up(self):
         self._animation_obj.pick_up()
     
@@ -398,18 +584,19 @@ class Picker(Entity):
     def _sled_animation(self):
         self.raise_to_top()
         if self.confine_sled_target_pos:
-            if self.sled_target_pos > self.sled_max_pos:
-                self.sled_target_pos = self.sled_max_pos
-            elif self.sled_target_pos < self.sled_min_pos:
-                self.sled_target_pos = self.sled_min_pos
+            if self._sled_target_pos > self.sled_max_pos:
+                self._sled_target_pos = self.sled_max_pos
+            elif self._sled_target_pos < self.sled_min_pos:
+                self._sled_target_pos = self.sled_min_pos
         
         self.sled_in_pos = False
-        if self.sled_actual_pos < self.sled_target_pos:
+        if self.sled_actual_pos < self._sled_target_pos:
             self.sled_actual_pos += self._animation_speed
-        elif self.sled_actual_pos > self.sled_target_pos:
+        elif self.sled_actual_pos > self._sled_target_pos:
             self.sled_actual_pos -= self._animation_speed
         else:
             self.sled_in_pos = True
+            World.sleep_animation(self._sled_animation)  # until the next sled_target_pos
             return
 
         self._animation_obj.pos = self._animation_pos + self.orientation.value * self.sled_actual_pos
@@ -422,16 +609,18 @@ class Remover(Entity):
     
     def __init__(self, parent:Entity, pos:Vector, size:Vector):
         Entity.__init__(self, parent=parent, pos=pos)
-        self.size = size
+        self.size = Vector(*size) if not isinstance(size, Vector) else size  # [x, y] in JSON save files
         
-        RenderContainer.create_rectangle(self, pos=Vector(0,0), size=size, fill="red")
-        Trigger(self, collider=AABB_Collider(self, pos=Vector(0,0), size=size), check_group=World.layers[0], check_types=(Stack,)).register(type=TriggerTypes.ENTER, func=lambda e: e.remove())
+        RenderContainer.create_rectangle(self, pos=Vector(0,0), size=self.size, fill="red")
+        Trigger(self, collider=AABB_Collider(self, pos=Vector(0,0), size=self.size), check_group=World.layers[0], check_types=(Stack,)).register(type=TriggerTypes.ENTER, func=lambda e: e.remove())
         self.update()
 
 
 @register_entity
 class PLC_Status(Entity, PLC_OPCua):
     add_to_layers = False
+    snapshot_exclude = Entity.snapshot_exclude | {"_inputs", "_written",  # both mirror the OPC UA server
+                                                  "_server", "_shared", "_callback_handles"}  # fixed while the module lives
     
     def __init__(self, parent, pos:Vector, endpoint:str, name:str):
         Entity.__init__(self, parent=parent, pos=pos)
@@ -444,6 +633,7 @@ class PLC_Status(Entity, PLC_OPCua):
         self.ack:bool = False
         self.busy:bool = False
         self.ready:bool = False
+        self._opc_state:tuple = None
         
         self._init_render_containers()
     
@@ -460,12 +650,13 @@ class PLC_Status(Entity, PLC_OPCua):
         RenderContainer.create_text(self, pos=Vector(25, 80), text="Ready", anchor="w")
         self.ready_indicator = RenderContainer.create_oval(self, pos=Vector(0,75), size=Vector(20,20), fill="lightgrey")
         
-        RenderContainer.create_window(self, pos=Vector(0, 100), tk_element=tk.Scale(World.instance.canvas, 
-                                                                                    orient=tk.HORIZONTAL,
-                                                                                    length=50, to=1,
-                                                                                    showvalue=False,
-                                                                                    sliderlength=25,
-                                                                                    command=self._func_switch_main))
+        if World.instance.canvas is not None:  # headless worlds have no main switch, set self.ready directly
+            RenderContainer.create_window(self, pos=Vector(0, 100), tk_element=tk.Scale(World.instance.canvas, 
+                                                                                        orient=tk.HORIZONTAL,
+                                                                                        length=50, to=1,
+                                                                                        showvalue=False,
+                                                                                        sliderlength=25,
+                                                                                        command=self._func_switch_main))
         self.update()
         
     def _func_switch_main(self, value):
@@ -480,6 +671,13 @@ class PLC_Status(Entity, PLC_OPCua):
         
         Entity._update(self)
     
+    def update_opc(self):
+        PLC_OPCua.update_opc(self)
+        opc_state = (self.start, self.order, self.ack, self.busy, self.ready, self.msg, self._state)
+        if opc_state != self._opc_state:  # handshake moved on or new input from the OPC client / main switch
+            self._opc_state = opc_state
+            World.activity += 1
+    
     def remove(self):
         Entity.remove(self)
         PLC_OPCua.remove(self)
@@ -488,15 +686,22 @@ class PLC_Status(Entity, PLC_OPCua):
 @register_entity
 class PLC(Entity):
     add_to_layers = False
+    save_children = False  # the status is built by __init__
     instances = []
     
     def __init__(self, parent:Entity, pos:Vector, endpoint:str, name:str):
         Entity.__init__(self, parent=parent, pos=pos)
         self.name = name
+        self.endpoint = endpoint
         
         self.status = PLC_Status(self, pos=Vector(5,5), endpoint=endpoint, name=self.name)
         
+        built = len(self.parent.children)
         self._init_sim()
+        for entity in self.parent.children[built:]:  # the module is built next to the PLC, loading the PLC builds it again
+            if not entity.dont_save:  # Stacks stay runtime Entities
+                entity.dont_save = True
+                entity.built_by = self
         self._init_plc()
         self.instances.append(self)
     
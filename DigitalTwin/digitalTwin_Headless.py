@@ -0,0 +1,137 @@
+from digitalTwin_base import World, Trigger, RenderBackend, HeadlessRenderBackend, TIMINGS
+from digitalTwin_Entities import PLC, PLC_OPCua
+from digitalTwin_Metrics import METRICS, COSTS
+
+import heapq
+import itertools
+import time
+
+
+def step_plant(render:bool=True, skip_idle:bool=False) -> bool:
+    """
+    One tick of the whole plant: world simulation, PLC logic and OPC UA exchange
+    With skip_idle a quiescent world only peeks at the OPC UA inputs, returns False if the tick was skipped
+    """
+    if skip_idle and World.is_quiescent() and not any([x.has_new_input() for x in PLC_OPCua.instances]):
+        World.skip_ticks()
+        return False
+    activity = World.activity
+    TIMINGS["t_start"] = time.perf_counter()
+    World.update_world(render=render)  # update simulation
+    TIMINGS["t_world"] = time.perf_counter()
+    if COSTS.enabled:
+        [COSTS.call("logic", x, x.update_logic) for x in PLC.instances]
+    else:
+        [x.update_logic() for x in PLC.instances]
+    TIMINGS["t_logic"] = time.perf_counter()
+    if COSTS.enabled:
+        [COSTS.call("opc", x, x.update_opc) for x in PLC_OPCua.instances]
+    else:
+        [x.update_opc() for x in PLC_OPCua.instances]
+    PLC_OPCua.flush_outputs()  # one hop into the OPC UA ThreadLoop for all modules
+    TIMINGS["t_opc"] = time.perf_counter()
+    METRICS.record_tick(TIMINGS, World.tick_counts)
+    World.update_quiescence(activity)
+    return True
+
+
+class HeadlessSimulation:
+    """
+    Runs the World without a display and without the 100ms after() cadence of Simulation.start
+    The default HeadlessRenderBackend turns all canvas calls into no-ops
+    
+    With skip_idle, run() jumps over quiescent stretches straight to the next input registered with schedule()
+    or the next World timer (World.schedule_at / World.schedule_in)
+    """
+    def __init__(self, backend:RenderBackend=None, skip_idle:bool=False):
+        self.world = World(backend=backend if backend else HeadlessRenderBackend())
+        self.skip_idle:bool = skip_idle
+        self.ticks:int = 0
+        self.skipped_ticks:int = 0
+        self._inputs:list = list()  # heap of (tick, seq, func)
+        self._seq = itertools.count()
+        self.autosave = None  # digitalTwin_SaveFile.Autosave, checked once per step
+    
+    def schedule(self, tick:int, func):
+        """Calls func() right before the given tick is simulated (external input, e.g. an OPC order)"""
+        heapq.heappush(self._inputs, (tick, next(self._seq), func))
+    
+    def _apply_inputs(self):
+        while self._inputs and self._inputs[0][0] <= self.ticks:
+            heapq.heappop(self._inputs)[2]()
+    
+    def step(self):
+        self._apply_inputs()
+        if not step_plant(skip_idle=self.skip_idle):
+            self.skipped_ticks += 1
+        self.ticks += 1
+        if self.autosave:
+            self.autosave.update()
+    
+    def run(self, ticks:int):
+        end = self.ticks + ticks
+        while self.ticks < end:
+            self.step()
+            if self.skip_idle and World.is_quiescent():
+                # nothing changes until the next input or timer, jump there (OPC inputs got checked by the last step)
+                target = min(self._inputs[0][0], end) if self._inputs else end
+                timer_tick = World.next_timer_tick()
+                if timer_tick is not None:
+                    target = min(target, self.ticks + timer_tick - World.tick)
+                if target > self.ticks:
+                    World.skip_ticks(target - self.ticks)
+                    self.skipped_ticks += target - self.ticks
+                    self.ticks = target
+    
+    def clear(self):
+        [x.remove() for x in list(self.world.children)]
+
+
+if __name__ == "__main__":
+    import argparse
+    from digitalTwin import create_plant
+    
+    parser = argparse.ArgumentParser(description="Runs the Module 1 - Module 3b plant without a display")
+    parser.add_argument("--ticks", type=int, default=1000, help="number of simulation ticks")
+    parser.add_argument("--ready", action="store_true", help="switch all modules to ready (there is no main switch without a display)")
+    parser.add_argument("--vectorized-triggers", action="store_true", help="evaluate the Triggers in one NumPy pass per tick")
+    parser.add_argument("--skip-idle", action="store_true", help="jump over ticks while the plant is quiescent")
+    parser.add_argument("--metrics", metavar="PATH", help="write the tick metrics to PATH (.json or .csv)")
+    parser.add_argument("--costs", metavar="PATH", help="attribute the callback costs to Entities and write them to PATH (.json)")
+    parser.add_argument("--shared-opc", metavar="ENDPOINT", help="host all modules in one OPC UA server, e.g. opc.tcp://localhost:4840")
+    parser.add_argument("--autosave", metavar="DIR", help="write checkpoints to DIR in the background")
+    parser.add_argument("--autosave-interval", type=float, default=60.0, help="seconds between two checkpoints")
+    args = parser.parse_args()
+    Trigger.vectorized = args.vectorized_triggers
+    COSTS.enabled = bool(args.costs)
+    PLC_OPCua.SHARED_ENDPOINT = args.shared_opc
+    
+    sim = HeadlessSimulation(skip_idle=args.skip_idle)
+    plcs = create_plant(sim.world)
+    if args.ready:
+        for plc in plcs:
+            plc.status.ready = True
+    if args.autosave:
+        from digitalTwin_SaveFile import Autosave
+        sim.autosave = Autosave(sim.world, args.autosave, interval=args.autosave_interval)
+    
+    t_start = time.perf_counter()
+    sim.run(args.ticks)
+    t_run = time.perf_counter() - t_start
+    print(f"{sim.ticks} ticks in {t_run:.3f}s ({sim.ticks / t_run:.0f} ticks/s, {sim.skipped_ticks} skipped)")
+    for phase, s in METRICS.summary()["phases"].items():
+        if s["count"]:
+            print(f"  {phase:<11} p50 {s['p50']*1000:8.3f}ms  p95 {s['p95']*1000:8.3f}ms  p99 {s['p99']*1000:8.3f}ms  max {s['max']*1000:8.3f}ms")
+    if args.metrics:
+        if args.metrics.endswith(".csv"):
+            METRICS.export_csv(args.metrics)
+        else:
+            METRICS.export_json(args.metrics)
+    if args.costs:
+        COSTS.export_json(args.costs)
+        for row in COSTS.by_type()[:10]:
+            print(f"  {row['phase']:<11}{row['type']:<14}{row['calls']:>8} calls {row['time']*1000:10.2f}ms")
+    
+    if sim.autosave:
+        sim.autosave.stop()
+    sim.clear()
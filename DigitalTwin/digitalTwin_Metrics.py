@@ -0,0 +1,217 @@
+from collections import deque
+import csv
+import json
+import math
+import time
+
+
+def percentile(values:list[float], p:float) -> float:
+    """Nearest rank percentile of values, p in [0, 100], None without values"""
+    if not values:
+        return None
+    return sorted(values)[_rank(len(values), p) - 1]
+
+
+def _rank(count:int, p:float) -> int:
+    return max(math.ceil(count * p / 100), 1)
+
+
+class Histogram:
+    """
+    Log bucketed latency histogram (bucket width ~5%), constant memory for arbitrarily long runs
+    Percentiles are the upper edge of their bucket, clamped to the observed min/max
+    exact=True keeps one bucket per value (for small integer counts)
+    """
+    GROWTH = 1.05
+    MIN_VALUE = 1e-7  # seconds, everything below lands in bucket 0
+    
+    def __init__(self, exact:bool=False):
+        self.exact:bool = exact
+        self.buckets:dict[int, int] = dict()
+        self.count:int = 0
+        self.total:float = 0.0
+        self.min:float = None
+        self.max:float = None
+    
+    def add(self, value:float):
+        if self.exact:
+            bucket = value
+        else:
+            bucket = int(math.log(value / self.MIN_VALUE, self.GROWTH)) + 1 if value > self.MIN_VALUE else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+    
+    def percentile(self, p:float) -> float:
+        """p in [0, 100]"""
+        if not self.count:
+            return None
+        rank = _rank(self.count, p)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                if self.exact:
+                    return bucket
+                value = self.MIN_VALUE * self.GROWTH ** bucket
+                return min(max(value, self.min), self.max)
+        return self.max
+    
+    def summary(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "min": self.min,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                "max": self.max}
+
+
+class TickMetrics:
+    """
+    Per phase latency histograms and per tick counts of the simulation loop
+    
+    step_plant records a tick from the TIMINGS timestamps, World.render_world records the render phase
+    (several ticks share one render with the fixed timestep of Simulation.start).
+    The last HISTORY ticks are kept as rows for time series.
+    
+        METRICS.summary()             # {"phases": {"trigger": {"p50": ...}}, "counts": {...}}
+        METRICS.export_json(path)
+        METRICS.export_csv(path)      # one row per phase and count
+        METRICS.export_history_csv(path)
+    """
+    PHASES = ("trigger", "events", "updates", "animations", "render", "logic", "opc", "tick")
+    COUNTS = ("events", "updates", "renders")
+    HISTORY = 10000
+    
+    # phase: (end, start) in TIMINGS
+    _SPANS = {"trigger": ("t_trigger", "t_start"),
+              "events": ("t_events", "t_trigger"),
+              "updates": ("t_updates", "t_events"),
+              "animations": ("t_animations", "t_updates"),
+              "logic": ("t_logic", "t_world"),
+              "opc": ("t_opc", "t_logic"),
+              "tick": ("t_opc", "t_start")}
+    
+    def __init__(self):
+        self.enabled:bool = True
+        self.reset()
+    
+    def reset(self):
+        self.phases:dict[str, Histogram] = {x: Histogram() for x in self.PHASES}
+        self.counts:dict[str, Histogram] = {x: Histogram(exact=True) for x in self.COUNTS}
+        self.history:deque[dict] = deque(maxlen=self.HISTORY)
+        self.ticks:int = 0
+    
+    def record_tick(self, timings:dict, counts:dict):
+        if not self.enabled:
+            return
+        row = {"tick": self.ticks}
+        for phase, (end, start) in self._SPANS.items():
+            value = timings[end] - timings[start]
+            self.phases[phase].add(value)
+            row[phase] = value
+        for name in ("events", "updates"):
+            self.counts[name].add(counts[name])
+            row["n_" + name] = counts[name]
+        self.history.append(row)
+        self.ticks += 1
+    
+    def record_render(self, duration:float, renders:int):
+        if not self.enabled:
+            return
+        self.phases["render"].add(duration)
+        self.counts["renders"].add(renders)
+    
+    def summary(self) -> dict:
+        return {"ticks": self.ticks,
+                "phases": {k: v.summary() for k, v in self.phases.items()},  # seconds
+                "counts": {k: v.summary() for k, v in self.counts.items()}}
+    
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+    
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("kind", "name", "count", "mean", "min", "p50", "p95", "p99", "max"))
+            for kind, histograms in (("phase_s", self.phases), ("per_tick", self.counts)):
+                for name, histogram in histograms.items():
+                    s = histogram.summary()
+                    writer.writerow((kind, name, s["count"], s["mean"], s["min"], s["p50"], s["p95"], s["p99"], s["max"]))
+    
+    def export_history_csv(self, path):
+        fields = ["tick"] + [x for x in self.PHASES if x in self._SPANS] + ["n_events", "n_updates"]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.history)
+
+
+
+class CostAttribution:
+    """
+    Opt-in cumulative time and call counts of the simulation callbacks per owning Entity, Entity type and callback
+    Phases: events (trigger callbacks), updates (Entity._update), animations, logic (PLC.update_logic), opc
+    
+        COSTS.enabled = True
+        ...
+        COSTS.by_type("events")[:5]    # the most expensive Entity types
+        COSTS.by_entity()[:5]          # the most expensive instances
+    """
+    def __init__(self):
+        self.enabled:bool = False
+        self.reset()
+    
+    def reset(self):
+        self._entities:dict[tuple, list] = dict()  # (phase, id(owner)) -> [label, type, calls, time]
+        self._types:dict[tuple, list] = dict()  # (phase, type) -> [calls, time]
+        self._callbacks:dict[tuple, list] = dict()  # (phase, qualname) -> [calls, time]
+    
+    def call(self, phase:str, owner, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) and books the time on owner (None: the callback only)"""
+        t_start = time.perf_counter()
+        result = func(*args, **kwargs)
+        duration = time.perf_counter() - t_start
+        
+        owner_type = type(owner).__name__ if owner is not None else "<none>"
+        key = (phase, id(owner))
+        entry = self._entities.get(key)
+        if entry is None or entry[1] != owner_type:  # new owner (or a reused id)
+            entry = self._entities[key] = [getattr(owner, "name", None) or str(owner), owner_type, 0, 0.0]
+        entry[2] += 1
+        entry[3] += duration
+        for table, name in ((self._types, owner_type), (self._callbacks, getattr(func, "__qualname__", str(func)))):
+            entry = table.setdefault((phase, name), [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+        return result
+    
+    def by_entity(self, phase:str=None) -> list[dict]:
+        """Sorted by time, most expensive first"""
+        rows = [{"phase": k[0], "entity": v[0], "type": v[1], "calls": v[2], "time": v[3]} 
+                for k, v in self._entities.items() if phase is None or k[0] == phase]
+        return sorted(rows, key=lambda x: x["time"], reverse=True)
+    
+    def by_type(self, phase:str=None) -> list[dict]:
+        rows = [{"phase": k[0], "type": k[1], "calls": v[0], "time": v[1]} 
+                for k, v in self._types.items() if phase is None or k[0] == phase]
+        return sorted(rows, key=lambda x: x["time"], reverse=True)
+    
+    def by_callback(self, phase:str=None) -> list[dict]:
+        rows = [{"phase": k[0], "callback": k[1], "calls": v[0], "time": v[1]} 
+                for k, v in self._callbacks.items() if phase is None or k[0] == phase]
+        return sorted(rows, key=lambda x: x["time"], reverse=True)
+    
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"entities": self.by_entity(), "types": self.by_type(), "callbacks": self.by_callback()}, f, indent=4)
+
+
+METRICS = TickMetrics()
+COSTS = CostAttribution()
@@ -0,0 +1,637 @@
+from digitalTwin_base import Vector, Entity, World, WorldSnapshot, Orientation, TriggerTypes, ENTITY_REGISTER, save_fields
+
+from enum import Enum
+from operator import attrgetter
+from pathlib import Path
+import copy
+import itertools
+import os
+import queue
+import struct
+import threading
+import time
+
+
+MAGIC = b"DTWB"
+VERSION = 1
+
+# record kinds, every record is <varint length><kind><payload>
+REC_TYPE = 1  # name, field names; the n-th type record defines type id n
+REC_ENUM = 2  # "Orientation.EAST"; the n-th enum record defines enum id n
+REC_ENTITY = 3  # type id, depth, one value per field of the type
+# autosave checkpoints
+REC_CHECKPOINT = 4  # sequence number, sequence number of the full base (itself for a full base)
+REC_NODE = 5  # key, parent key (0 for the World), type id, one value per field of the type
+REC_REMOVED = 6  # key
+REC_STATE = 7  # key, dict of the dynamic attributes (see Autosave)
+
+# value tags
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_STR, T_VECTOR, T_INT_VECTOR, T_ENUM, T_LIST, T_TUPLE, T_DICT, T_ENTITY = range(13)
+
+ENUMS = {x.__name__: x for x in (Orientation, TriggerTypes)}
+
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_VECTOR = struct.Struct("<dd")
+_INT_VECTOR = struct.Struct("<ii")  # layouts mostly use integer coordinates
+
+
+def _varint(value:int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+class EntityRef:
+    """An Entity in an autosave state, by its checkpoint key"""
+    __slots__ = ("key",)
+    
+    def __init__(self, key:int):
+        self.key:int = key
+    
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EntityRef) and other.key == self.key
+    
+    def __hash__(self):
+        return hash(self.key)
+    
+    def __repr__(self) -> str:
+        return f"EntityRef({self.key})"
+
+
+class EntitySerializer:
+    """Field names and one attrgetter for all of them, built once per registered class"""
+    _cache:dict[type, "EntitySerializer"] = dict()
+    
+    def __init__(self, cls:type):
+        self.name:str = cls.__name__
+        self.fields:tuple[str] = save_fields(cls)
+        getter = attrgetter(*self.fields) if self.fields else lambda x: ()
+        self.values = getter if len(self.fields) != 1 else lambda x: (getter(x),)
+    
+    @classmethod
+    def get(cls, entity_cls:type) -> "EntitySerializer":
+        serializer = cls._cache.get(entity_cls)
+        if serializer is None:
+            serializer = cls._cache[entity_cls] = EntitySerializer(entity_cls)
+        return serializer
+
+
+class BinarySaveWriter:
+    """
+    Writes Entities one record at a time to a binary file object, type and enum names are written once
+    
+        with open(path, "wb") as f:
+            BinarySaveWriter(f).write_world(world)
+    """
+    def __init__(self, f):
+        self._f = f
+        self._types:dict[type, tuple[int, EntitySerializer]] = dict()
+        self._enums:dict[Enum, int] = dict()
+        f.write(MAGIC + bytes((VERSION,)))
+    
+    def _record(self, data:bytearray):
+        self._f.write(_varint(len(data)))
+        self._f.write(data)
+    
+    def write_world(self, world:World):
+        stack = [(x, 0) for x in reversed(world.children) if not x.dont_save]
+        while stack:  # depth first, a parent is always written before its children
+            entity, depth = stack.pop()
+            self.write_entity(entity, depth)
+            if entity.save_children:
+                stack.extend([(x, depth + 1) for x in reversed(entity.children) if not x.dont_save])
+    
+    def _type(self, cls:type) -> tuple[int, EntitySerializer]:
+        entry = self._types.get(cls)
+        if entry is None:
+            serializer = EntitySerializer.get(cls)
+            data = bytearray((REC_TYPE,))
+            for name in (serializer.name,) + serializer.fields:
+                self._write_str(data, name)
+            self._record(data)
+            entry = self._types[cls] = (len(self._types), serializer)
+        return entry
+    
+    def write_entity(self, entity:Entity, depth:int):
+        type_id, serializer = self._type(entity.__class__)
+        data = bytearray((REC_ENTITY,))
+        data += _varint(type_id)
+        data += _varint(depth)
+        for value in serializer.values(entity):
+            self._write_value(data, value)
+        self._record(data)
+    
+    def write_checkpoint(self, seq:int, base:int):
+        self._record(bytearray((REC_CHECKPOINT,)) + _varint(seq) + _varint(base))
+    
+    def write_node(self, key:int, parent_key:int, cls:type, values:tuple):
+        type_id, _ = self._type(cls)
+        data = bytearray((REC_NODE,))
+        data += _varint(key)
+        data += _varint(parent_key)
+        data += _varint(type_id)
+        for value in values:
+            self._write_value(data, value)
+        self._record(data)
+    
+    def write_removed(self, key:int):
+        self._record(bytearray((REC_REMOVED,)) + _varint(key))
+    
+    def write_state(self, key:int, state:dict):
+        data = bytearray((REC_STATE,))
+        data += _varint(key)
+        self._write_value(data, state)
+        self._record(data)
+    
+    def _write_str(self, data:bytearray, value:str):
+        encoded = value.encode()
+        data += _varint(len(encoded))
+        data += encoded
+    
+    def _write_value(self, data:bytearray, value):
+        if value is None:
+            data.append(T_NONE)
+        elif value is True or value is False:
+            data.append(T_TRUE if value else T_FALSE)
+        elif isinstance(value, int):
+            data.append(T_INT)
+            data += _INT.pack(value)
+        elif isinstance(value, float):
+            data.append(T_FLOAT)
+            data += _FLOAT.pack(value)
+        elif isinstance(value, str):
+            data.append(T_STR)
+            self._write_str(data, value)
+        elif isinstance(value, Vector):
+            if type(value.x) is int and type(value.y) is int and -2**31 <= value.x < 2**31 and -2**31 <= value.y < 2**31:
+                data.append(T_INT_VECTOR)
+                data += _INT_VECTOR.pack(value.x, value.y)
+            else:
+                data.append(T_VECTOR)
+                data += _VECTOR.pack(value.x, value.y)
+        elif isinstance(value, Enum):
+            enum_id = self._enums.get(value)
+            if enum_id is None:  # the record has to precede the entity record that uses it
+                record = bytearray((REC_ENUM,))
+                self._write_str(record, f"{value.__class__.__name__}.{value.name}")
+                self._record(record)
+                enum_id = self._enums[value] = len(self._enums)
+            data.append(T_ENUM)
+            data += _varint(enum_id)
+        elif isinstance(value, (list, tuple)):
+            data.append(T_LIST if isinstance(value, list) else T_TUPLE)
+            data += _varint(len(value))
+            [self._write_value(data, x) for x in value]
+        elif isinstance(value, dict):
+            data.append(T_DICT)
+            data += _varint(len(value))
+            for k, v in value.items():
+                self._write_value(data, k)
+                self._write_value(data, v)
+        elif isinstance(value, EntityRef):
+            data.append(T_ENTITY)
+            data += _varint(value.key)
+        else:
+            raise TypeError(f"can not save {type(value).__name__} {value!r}")
+
+
+class BinarySaveReader:
+    """
+    Reads the records of a binary save file one at a time and creates the Entities right away
+    
+        with open(path, "rb") as f:
+            BinarySaveReader(f).read_world(world)
+    """
+    def __init__(self, f):
+        self._f = f
+        self._types:list[tuple[type, tuple[str]]] = list()
+        self._enums:list[Enum] = list()
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a binary digital twin save file")
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f"unsupported save file version {header[len(MAGIC)]}")
+    
+    def _read_varint(self) -> int:
+        value, shift = 0, 0
+        while True:
+            byte = self._f.read(1)
+            if not byte:
+                return None  # end of file
+            value |= (byte[0] & 0x7F) << shift
+            if byte[0] < 0x80:
+                return value
+            shift += 7
+    
+    def records(self):
+        """Yields the records (kind byte + payload) without the length prefix"""
+        while True:
+            length = self._read_varint()
+            if length is None:
+                return
+            data = self._f.read(length)
+            if len(data) != length:
+                raise EOFError("truncated save file")
+            yield data
+    
+    def read_world(self, world:World) -> list[Entity]:
+        """Creates the saved Entities below world, returns the top level Entities"""
+        parents:list = [world]
+        created = list()
+        for data in self.records():
+            kind, offset = data[0], 1
+            if kind == REC_ENTITY:
+                type_id, offset = self._read_varint_from(data, offset)
+                depth, offset = self._read_varint_from(data, offset)
+                cls, kwargs = self._read_kwargs(type_id, data, offset)
+                del parents[depth+1:]
+                entity = cls(parent=parents[depth], **kwargs)
+                parents.append(entity)
+                if depth == 0:
+                    created.append(entity)
+            elif not self._read_definition(kind, data, offset):
+                raise ValueError(f"unknown record kind {kind}")
+        return created
+    
+    def read_checkpoint(self) -> tuple[int, int, dict[int, tuple], dict[int, dict], list[int]]:
+        """Returns sequence number, base sequence number, {key: (parent key, class, kwargs)}, {key: state} and the removed keys"""
+        seq, base, nodes, states, removed = None, None, dict(), dict(), list()
+        for data in self.records():
+            kind, offset = data[0], 1
+            if kind == REC_CHECKPOINT:
+                seq, offset = self._read_varint_from(data, offset)
+                base, offset = self._read_varint_from(data, offset)
+            elif kind == REC_NODE:
+                key, offset = self._read_varint_from(data, offset)
+                parent_key, offset = self._read_varint_from(data, offset)
+                type_id, offset = self._read_varint_from(data, offset)
+                nodes[key] = (parent_key, *self._read_kwargs(type_id, data, offset))
+            elif kind == REC_STATE:
+                key, offset = self._read_varint_from(data, offset)
+                states[key] = self._read_value(data, offset)[0]
+            elif kind == REC_REMOVED:
+                removed.append(self._read_varint_from(data, offset)[0])
+            elif not self._read_definition(kind, data, offset):
+                raise ValueError(f"unknown record kind {kind}")
+        return seq, base, nodes, states, removed
+    
+    def _read_definition(self, kind:int, data:bytes, offset:int) -> bool:
+        if kind == REC_TYPE:
+            names = list()
+            while offset < len(data):
+                name, offset = self._read_str(data, offset)
+                names.append(name)
+            self._types.append((ENTITY_REGISTER[names[0]], tuple(names[1:])))
+        elif kind == REC_ENUM:
+            name, offset = self._read_str(data, offset)
+            enum_name, member = name.split(".")
+            self._enums.append(ENUMS[enum_name][member])
+        else:
+            return False
+        return True
+    
+    def _read_kwargs(self, type_id:int, data:bytes, offset:int) -> tuple[type, dict]:
+        cls, fields = self._types[type_id]
+        kwargs = dict()
+        for field in fields:
+            kwargs[field], offset = self._read_value(data, offset)
+        return cls, kwargs
+    
+    @staticmethod
+    def _read_varint_from(data:bytes, offset:int) -> tuple[int, int]:
+        value, shift = 0, 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, offset
+            shift += 7
+    
+    def _read_str(self, data:bytes, offset:int) -> tuple[str, int]:
+        length, offset = self._read_varint_from(data, offset)
+        return data[offset:offset+length].decode(), offset + length
+    
+    def _read_value(self, data:bytes, offset:int):
+        tag = data[offset]
+        offset += 1
+        if tag == T_NONE:
+            return None, offset
+        elif tag == T_FALSE or tag == T_TRUE:
+            return tag == T_TRUE, offset
+        elif tag == T_INT:
+            return _INT.unpack_from(data, offset)[0], offset + 8
+        elif tag == T_FLOAT:
+            return _FLOAT.unpack_from(data, offset)[0], offset + 8
+        elif tag == T_STR:
+            return self._read_str(data, offset)
+        elif tag == T_VECTOR:
+            return Vector(*_VECTOR.unpack_from(data, offset)), offset + 16
+        elif tag == T_INT_VECTOR:
+            return Vector(*_INT_VECTOR.unpack_from(data, offset)), offset + 8
+        elif tag == T_ENUM:
+            enum_id, offset = self._read_varint_from(data, offset)
+            return self._enums[enum_id], offset
+        elif tag == T_LIST or tag == T_TUPLE:
+            length, offset = self._read_varint_from(data, offset)
+            values = list()
+            for _ in range(length):
+                value, offset = self._read_value(data, offset)
+                values.append(value)
+            return (values if tag == T_LIST else tuple(values)), offset
+        elif tag == T_DICT:
+            length, offset = self._read_varint_from(data, offset)
+            values = dict()
+            for _ in range(length):
+                key, offset = self._read_value(data, offset)
+                values[key], offset = self._read_value(data, offset)
+            return values, offset
+        elif tag == T_ENTITY:
+            key, offset = self._read_varint_from(data, offset)
+            return EntityRef(key), offset
+        raise ValueError(f"unknown value tag {tag}")
+
+
+def save_binary(world:World, path):
+    with open(path, "wb") as f:
+        BinarySaveWriter(f).write_world(world)
+
+
+def load_binary(world:World, path) -> list[Entity]:
+    with open(path, "rb") as f:
+        return BinarySaveReader(f).read_world(world)
+
+
+UNSAVED = object()  # marks attributes Autosave can't write
+
+
+class Autosave:
+    """
+    Periodic checkpoints of the running plant without stalling the simulation
+    
+    update() (simulation thread) only collects the state of every Entity when a checkpoint is due: the dynamic
+    attributes (positions, Stack.stack, stopper, picker and handshake state, Trigger present entities, ...) and
+    the Entities that are not part of the layout (dont_save and not built_by a PLC, e.g. Stacks) with their class and field values.
+    A worker thread compares them with the last checkpoint and writes a delta file with the new, changed and
+    removed rows, every full_every-th checkpoint is a full base. Files of older bases than the last keep_bases
+    are deleted.
+    
+    The layout itself is not part of a checkpoint (that is what the Save button is for), restore() needs a world
+    built from the same layout (e.g. create_plant). Layout Entities are keyed by their position in the tree.
+    Queued events and timers are not saved.
+    
+        autosave = Autosave(world, "autosave", interval=60)
+        autosave.update()  # once per frame / tick
+        ...
+        Autosave.restore(world, "autosave")  # latest base + its deltas
+    """
+    RUNTIME_KEYS = 1 << 32  # keys of the Entities that are not part of the layout, the layout counts from 1 (0 is the World)
+    STATE_EXCLUDE = frozenset(("parent", "colliders", "renders", "triggers", "built_by", "_autosave_key"))  # structure, rebuilt by __init__
+    _keys = itertools.count(RUNTIME_KEYS)
+    
+    def __init__(self, world:World, directory, interval:float=60.0, full_every:int=10, keep_bases:int=2, prefix:str="autosave"):
+        self.world:World = world
+        self.directory:Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval:float = interval  # seconds
+        self.full_every:int = full_every
+        self.keep_bases:int = keep_bases
+        self.prefix:str = prefix
+        
+        self.seq:int = max([x[0] for x in self._files(self.directory, prefix)], default=0)
+        self.skipped:int = 0  # snapshots dropped because the worker was still writing
+        self._due:float = time.perf_counter() + interval
+        self._queue:queue.Queue = queue.Queue(maxsize=1)
+        self._last:dict[int, tuple] = None  # key: (parent key, class, values, state) of the last checkpoint
+        self._base:int = None
+        self._thread = threading.Thread(target=self._run, name="Autosave", daemon=True)
+        self._thread.start()
+    
+    def update(self):
+        if time.perf_counter() >= self._due:
+            self._due = time.perf_counter() + self.interval
+            self.checkpoint()
+    
+    def checkpoint(self):
+        """Takes a snapshot now, it is written in the background"""
+        try:
+            self._queue.put_nowait(self.snapshot())
+        except queue.Full:
+            self.skipped += 1
+    
+    @staticmethod
+    def _walk(world:World) -> tuple[list[tuple], dict[Entity, int]]:
+        """[(entity, key, parent key, part of the layout)] parents first, and the keys of all Entities"""
+        entities, keys, runtime = list(), {world: 0}, set()
+        layout_keys = itertools.count(1)
+        for entity in world._entities():
+            if entity.parent in runtime or (entity.dont_save and entity.built_by is None):
+                runtime.add(entity)
+                key = entity.__dict__.get("_autosave_key")
+                if key is None:
+                    key = entity._autosave_key = next(Autosave._keys)
+            else:
+                key = next(layout_keys)
+            keys[entity] = key
+            entities.append((entity, key, keys[entity.parent], entity not in runtime))
+        return entities, keys
+    
+    @staticmethod
+    def _value(value, keys:dict):
+        """value with Entities replaced by EntityRefs and sets by lists, UNSAVED for anything else (servers, Triggers, ...)"""
+        value_type = type(value)
+        if value is None or value_type in (bool, int, float, str, Vector):
+            return value
+        if isinstance(value, Entity):
+            key = keys.get(value)
+            return EntityRef(key) if key is not None else None
+        if value_type in (list, tuple, set, frozenset):
+            items = [Autosave._value(x, keys) for x in value if not isinstance(x, Entity) or x in keys]  # without removed Entities
+            if UNSAVED in items:
+                return UNSAVED
+            return tuple(items) if value_type is tuple else items
+        if value_type is dict:
+            items = {k: Autosave._value(v, keys) for k, v in value.items()}
+            if UNSAVED in items.values():
+                return UNSAVED
+            return items
+        if value_type in ENUMS.values():
+            return value
+        return UNSAVED
+    
+    @staticmethod
+    def _state(entity:Entity, keys:dict) -> dict:
+        state = dict()
+        for name, value, _ in WorldSnapshot.capture(entity, Autosave.STATE_EXCLUDE | entity.snapshot_exclude):
+            value = Autosave._value(value, keys)
+            if value is not UNSAVED:
+                state[name] = value
+        state["triggers"] = [Autosave._value(x._present_entities, keys) for x in entity.triggers]
+        state["renders"] = [x.pos for x in entity.renders]
+        return state
+    
+    def snapshot(self) -> list[tuple]:
+        """[(key, parent key, class, field values, state)], class and field values only for Entities that aren't part of the layout"""
+        entities, keys = self._walk(self.world)
+        rows = [(0, None, None, None, {"tick": World.tick, "layout": len([x for x in entities if x[3]]),
+                                       "children": self._value(self.world.children, keys),
+                                       "layers": [self._value(x, keys) for x in World.layers]})]
+        for entity, key, parent_key, layout in entities:
+            if layout:
+                cls, values = None, None
+            else:
+                cls = entity.__class__
+                values = EntitySerializer.get(cls).values(entity)
+                if any([isinstance(x, (list, dict)) for x in values]):  # e.g. Stack.stack, the rest is immutable
+                    values = tuple(copy.deepcopy(x) if isinstance(x, (list, dict)) else x for x in values)
+            state = self._state(entity, keys)
+            if any([isinstance(x, (list, dict)) for x in state.values()]):  # the worker compares them later
+                state = copy.deepcopy(state)
+            rows.append((key, parent_key, cls, values, state))
+        return rows
+    
+    def stop(self):
+        """Writes the pending snapshot and ends the worker"""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                return
+            self._write(rows)
+    
+    def _write(self, rows:list[tuple]):
+        self.seq += 1
+        current = {row[0]: row[1:] for row in rows}
+        full = self._last is None or (self.seq - self._base) >= self.full_every
+        if full:
+            self._base = self.seq
+        path = self.directory / f"{self.prefix}-{self.seq:08d}.dtb"
+        with open(path.with_suffix(".tmp"), "wb") as f:
+            writer = BinarySaveWriter(f)
+            writer.write_checkpoint(self.seq, self._base)
+            for key, (parent_key, cls, values, state) in current.items():
+                last = None if full else self._last.get(key)
+                if cls is not None and (last is None or last[:3] != (parent_key, cls, values)):
+                    writer.write_node(key, parent_key, cls, values)
+                if last is None or last[3] != state:
+                    writer.write_state(key, state)
+            if not full:
+                [writer.write_removed(x) for x in self._last.keys() - current.keys()]
+        os.replace(path.with_suffix(".tmp"), path)  # a crash never leaves a half written checkpoint
+        self._last = current
+        if full:
+            self._prune()
+    
+    def _prune(self):
+        files = self._files(self.directory, self.prefix)
+        bases = [seq for seq, base, _ in files if seq == base]
+        if len(bases) > self.keep_bases:
+            oldest = bases[-self.keep_bases]
+            [path.unlink() for seq, _, path in files if seq < oldest]
+    
+    @staticmethod
+    def _files(directory:Path, prefix:str) -> list[tuple[int, int, Path]]:
+        """(seq, base seq, path) sorted by seq, the header is read from every file"""
+        files = list()
+        for path in Path(directory).glob(f"{prefix}-*.dtb"):
+            with open(path, "rb") as f:
+                reader = BinarySaveReader(f)
+                data = next(reader.records())
+            seq, offset = reader._read_varint_from(data, 1)
+            files.append((seq, reader._read_varint_from(data, offset)[0], path))
+        return sorted(files)
+    
+    @staticmethod
+    def _resolve(value, entities:dict):
+        """EntityRefs back to Entities, the ones that don't exist anymore are dropped from containers"""
+        if isinstance(value, EntityRef):
+            return entities.get(value.key)
+        if type(value) is list or type(value) is tuple:
+            items = [Autosave._resolve(x, entities) for x in value if not isinstance(x, EntityRef) or x.key in entities]
+            return tuple(items) if type(value) is tuple else items
+        if type(value) is dict:
+            return {k: Autosave._resolve(v, entities) for k, v in value.items()}
+        return value
+    
+    @staticmethod
+    def _apply(entity:Entity, state:dict, entities:dict):
+        """Sets the state back like WorldSnapshot.apply, lists, sets and dicts are refilled in place"""
+        state = Autosave._resolve(state, entities)
+        for trigger, present in zip(entity.triggers, state.pop("triggers")):
+            WorldSnapshot.apply(trigger, [("_present_entities", set(present), None)])
+        for render, pos in zip(entity.renders, state.pop("renders")):
+            render.pos = pos
+        attributes = entity.__dict__
+        items = list()
+        for name, value in state.items():
+            current = attributes.get(name)
+            if (type(current) is list and type(value) is list) or (type(current) in (set, dict) and type(value) in (list, dict)):
+                items.append((name, current, value))  # e.g. Trigger.check_group aliases Spawner.spawned
+            else:
+                items.append((name, value, None))
+        WorldSnapshot.apply(entity, items)
+    
+    @staticmethod
+    def restore(world:World, directory, prefix:str="autosave") -> int:
+        """
+        Brings world (built from the layout of the checkpoints) to the latest base with all of its deltas:
+        the Entities that are not part of the layout are replaced by the saved ones, then the state of all
+        Entities is set back. Returns the sequence number (None without checkpoints)
+        """
+        files = Autosave._files(directory, prefix)
+        bases = [i for i, (seq, base, _) in enumerate(files) if seq == base]
+        if not bases:
+            return None
+        nodes:dict[int, tuple] = dict()
+        states:dict[int, dict] = dict()
+        seq = None
+        for seq, base, path in files[bases[-1]:]:
+            if base != files[bases[-1]][0]:
+                break
+            with open(path, "rb") as f:
+                _, _, new_nodes, new_states, removed = BinarySaveReader(f).read_checkpoint()
+            nodes.update(new_nodes)
+            states.update(new_states)
+            for key in removed:
+                nodes.pop(key, None)
+                states.pop(key, None)
+        
+        current, _ = Autosave._walk(world)
+        layout = [(entity, key) for entity, key, _, is_layout in current if is_layout]
+        if len(layout) != states[0]["layout"]:
+            raise ValueError(f"the checkpoints were taken from another layout ({states[0]['layout']} Entities, the world has {len(layout)})")
+        [entity.remove() for entity, _, _, is_layout in current if not is_layout and entity in entity.parent.children]
+        
+        entities:dict[int, Entity] = {0: world, **{key: entity for entity, key in layout}}
+        pending = sorted(nodes)
+        while pending:  # parents before children
+            created = [x for x in pending if nodes[x][0] in entities]
+            if not created:
+                raise ValueError(f"checkpoint Entities without parent: {pending}")
+            for key in created:
+                parent_key, cls, kwargs = nodes[key]
+                entity = entities[key] = cls(parent=entities[parent_key], **kwargs)
+                entity._autosave_key = key
+            pending = [x for x in pending if x not in entities]
+        Autosave._keys = itertools.count(max(max(nodes, default=0) + 1, Autosave.RUNTIME_KEYS))
+        
+        world_state = Autosave._resolve(states.pop(0), entities)
+        for key, state in states.items():
+            Autosave._apply(entities[key], state, entities)
+        world.children[:] = world_state["children"]
+        for layer, items in zip(World.layers, world_state["layers"]):
+            layer[:] = items
+        World.tick = world_state["tick"]
+        World.events.clear()
+        World.updates.clear()
+        World.timers.clear()
+        [World.wake_animation(x) for x in list(World.sleeping_animations)]  # they go back to sleep when idle
+        world._restored()
+        return seq
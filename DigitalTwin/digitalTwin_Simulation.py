@@ -1,5 +1,8 @@
-from digitalTwin_base import Vector, Entity, World, Orientation, TIMINGS
+from digitalTwin_base import Vector, Entity, World, Orientation
 from digitalTwin_Entities import Stopper, Wall, Stack, Conveyer, Sensor, Spawner, Picker, PLC, PLC_OPCua
+from digitalTwin_Headless import step_plant
+from digitalTwin_Metrics import METRICS
+from digitalTwin_SaveFile import save_binary, load_binary, Autosave
 
 from pathlib import Path
 import json
@@ -13,7 +16,7 @@ import time
 
 
 class SaveFileEncoder(json.JSONEncoder):
-    special_serializers = {Vector: lambda x: x.__repr__()}
+    special_serializers = {Vector: lambda x: [x.x, x.y]}  # Entity.__init__ accepts any (x, y) sequence
 
     def default(self, o):
         if hasattr(o, '_to_json'):
@@ -51,6 +54,10 @@ def debug(world):
 
 
 class Simulation(tk.Frame):
+    TICK_INTERVAL = 0.1  # simulated seconds per World tick (all speeds are given per tick)
+    FRAME_INTERVAL = 0.04  # seconds between two drawn frames
+    MAX_TICKS_PER_FRAME = 100  # a larger backlog is dropped, the simulation then runs slower than the time scale
+    
     def __init__(self, master:tk.Frame):
         tk.Frame.__init__(self, master=master)
         self.rowconfigure(0, weight=1)
@@ -62,22 +69,32 @@ class Simulation(tk.Frame):
         
         self.profiler = None
         self.profiler_ticks = 0
+        self.autosave:Autosave = None  # checkpoints in the background, see digitalTwin_SaveFile.Autosave
+        self.world_snapshot = None  # in memory rewind point
         
         self.mouse_select_pos:Vector = None
         self.mouse_selection:Entity = None
         self.mouse_pos_str:tk.StringVar = tk.StringVar(self)
         self.timing_info:tk.StringVar = tk.StringVar(self)
+        self.time_scale:tk.StringVar = tk.StringVar(self)
         
         f = tk.Frame(master=self)
         f.grid(row=1, column=0, sticky="SEW")
         f.columnconfigure(100, weight=1)
         tk.Label(master=f, textvariable=self.mouse_pos_str).grid(row=0, column=101, sticky="SE")
-        tk.Label(master=f, textvariable=self.timing_info, anchor="w", justify="left", width=20).grid(row=0, column=102, sticky="SE")
+        tk.Label(master=f, textvariable=self.timing_info, anchor="w", justify="left", width=30, font="TkFixedFont").grid(row=0, column=102, sticky="SE")
         tk.Button(master=f, text="Save", command=self.save).grid(row=0, column=0, sticky="SW")
         tk.Button(master=f, text="Load", command=self.load).grid(row=0, column=1, sticky="SW")
         tk.Button(master=f, text="Clear", command=self.clear).grid(row=0, column=2, sticky="SW")
+        tk.Button(master=f, text="Snapshot", command=self.take_snapshot).grid(row=0, column=3, sticky="SW")
+        tk.Button(master=f, text="Rewind", command=self.rewind).grid(row=0, column=4, sticky="SW")
         tk.Button(master=f, text="Debug", command=lambda: debug(self.world)).grid(row=0, column=50, sticky="SW")
         tk.Button(master=f, text="Start/Stop Profiler", command=self.enable_profiler).grid(row=0, column=51, sticky="SW")
+        tk.Button(master=f, text="Export Metrics", command=self.export_metrics).grid(row=0, column=54, sticky="SW")
+        tk.Button(master=f, text="Reset Metrics", command=METRICS.reset).grid(row=0, column=55, sticky="SW")
+        tk.Label(master=f, text="Speed").grid(row=0, column=52, sticky="SW")
+        tk.Spinbox(master=f, values=(0.5, 1, 2, 5, 10, 20, 50), textvariable=self.time_scale, width=4).grid(row=0, column=53, sticky="SW")
+        self.time_scale.set("1")
         self.canvas.bind('<Motion>', self.motion)
         self.canvas.bind('<Button-1>', self.button_1)  # left click
         self.canvas.bind('<Button-3>', self.button_3)  # right click
@@ -161,50 +178,100 @@ class Simulation(tk.Frame):
             self.mouse_selection.update()
                     
     def save(self):
-        with filedialog.asksaveasfile(mode="w", initialdir=Path(__file__).parent) as f:
+        path = filedialog.asksaveasfilename(initialdir=Path(__file__).parent, defaultextension=".json",
+                                            filetypes=(("JSON", "*.json"), ("Binary", "*.dtb")))
+        if not path:
+            return
+        if path.endswith(".dtb"):
+            save_binary(self.world, path)
+            return
+        with open(path, "w") as f:
             f.write(json.dumps(self.world.save(),  cls=SaveFileEncoder, indent=4, separators=(',', ': ')))
     
     def load(self):
-        with filedialog.askopenfile(mode="r", initialdir=Path(__file__).parent) as f:
-            self.world.load(json.loads(f.read()))
+        path = filedialog.askopenfilename(initialdir=Path(__file__).parent, filetypes=(("Save files", "*.json *.dtb"), ("All", "*")))
+        if not path:
+            return
+        if path.endswith(".dtb"):
+            load_binary(self.world, path)
+        else:
+            with open(path, "r") as f:
+                self.world.load(json.loads(f.read()))
         [x.update() for x in self.world.children]
         
+    def take_snapshot(self):
+        self.world_snapshot = self.world.snapshot()
+    
+    def rewind(self):
+        if self.world_snapshot:
+            self.mouse_selection = None
+            self.world.restore(self.world_snapshot)
+        
     def clear(self):
+        self.world_snapshot = None
         [x.remove() for x in list(self.world.children)]
+    
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(initialdir=Path(__file__).parent, defaultextension=".json",
+                                            filetypes=(("JSON", "*.json"), ("CSV", "*.csv")))
+        if not path:
+            return
+        if path.endswith(".csv"):
+            METRICS.export_csv(path)
+        else:
+            METRICS.export_json(path)
+        
+    def get_time_scale(self) -> float:
+        try:
+            return max(float(self.time_scale.get()), 0)
+        except ValueError:  # while the user is typing
+            return 1
         
     def start(self):
+        # fixed timestep: simulated time advances by TICK_INTERVAL per tick, independent of the frame rate
+        # every frame runs as many ticks as the elapsed time * time scale asks for and draws only the last state
+        self._frame_time = time.perf_counter()
+        self._tick_accumulator = 0.0
+        
         def animation():
-            if self.profiler_ticks:
-                self.profiler_ticks -= 1
-                if not self.profiler_ticks:
-                    self.disable_profiler()
-            TIMINGS["t_start"] = time.process_time()
-            World.update_world()  # update simulation
-            TIMINGS["t_world"] = time.process_time()
-            self.canvas.focus_set()
-            [x.update_logic() for x in PLC.instances]
-            TIMINGS["t_logic"] = time.process_time()
-            [x.update_opc() for x in PLC_OPCua.instances]
-            TIMINGS["t_opc"] = time.process_time()
+            t_frame = time.perf_counter()
+            self._tick_accumulator += (t_frame - self._frame_time) * self.get_time_scale()
+            self._frame_time = t_frame
+            ticks = int(self._tick_accumulator // self.TICK_INTERVAL)
+            self._tick_accumulator -= ticks * self.TICK_INTERVAL
+            ticks = min(ticks, self.MAX_TICKS_PER_FRAME)
             
-            def timings(t1, t2):
-                res = int((TIMINGS[t1]-TIMINGS[t2])*1000)
-                TIMINGS[t1+t2] = max(res, TIMINGS.get(t1+t2, 0))
-                return (res, TIMINGS[t1+t2])
-            total = int((TIMINGS["t_opc"]-TIMINGS["t_start"])*1000)
+            simulated = 0
+            for _ in range(ticks):
+                if self.profiler_ticks:
+                    self.profiler_ticks -= 1
+                    if not self.profiler_ticks:
+                        self.disable_profiler()
+                simulated += step_plant(render=False, skip_idle=True)  # update simulation, PLC logic and OPC (skipped while idle)
+            World.render_world()  # draw the final state of this frame
+            self.canvas.focus_set()
+            if self.autosave:
+                self.autosave.update()
             
-            self.timing_info.set("\n".join((
-                                        f'Total: {timings("t_opc", "t_start")}',
-                                        f'  World: {timings("t_world", "t_start")}',
-                                        f'    Trigger: {timings("t_trigger", "t_start")}',
-                                        f'    Events: {timings("t_events", "t_trigger")}',
-                                        f'    Updates: {timings("t_updates", "t_events")}',
-                                        f'    Render: {timings("t_render", "t_updates")}',
-                                        f'  Logic: {timings("t_logic", "t_world")}',
-                                        f'Entities: {len(self.world.layers[0])}',
-                                        f'Profiler: {self.profiler_ticks}',
-                                        )))
-            self.after(100-min(total, 99), animation)
+            if simulated:
+                summary = METRICS.summary()
+                
+                def percentiles(phase):
+                    p = summary["phases"][phase]
+                    if not p["count"]:
+                        return ""
+                    return f'{p["p50"]*1000:5.1f}{p["p95"]*1000:6.1f}{p["p99"]*1000:6.1f}'
+                
+                self.timing_info.set("\n".join((
+                                            f'ms          p50   p95   p99',
+                                            *(f'{x.capitalize():<11}{percentiles(x)}' for x in METRICS.PHASES),
+                                            f'Events/Tick: {World.tick_counts["events"]}',
+                                            f'Ticks/Frame: {simulated}/{ticks}',
+                                            f'Entities: {len(self.world.layers[0])}',
+                                            f'Profiler: {self.profiler_ticks}',
+                                            )))
+            elapsed = time.perf_counter() - t_frame
+            self.after(max(1, int((self.FRAME_INTERVAL - elapsed) * 1000)), animation)
         self.after(0, animation)
 
 
@@ -0,0 +1,204 @@
+"""
+Runs what-if scenarios of a layout as independent headless simulations in a process pool
+
+    python digitalTwin_Sweep.py scenarios.json --workers 8 --json results.json
+
+scenarios.json holds the defaults and a list of parameter sets, every set overrides the defaults:
+    {"layout": "plant", "ticks": 5000,
+     "scenarios": [{"name": "base"},
+                   {"name": "fast belts", "conveyor_speed": 2},
+                   {"name": "blue", "spawner_stack": [{"color": "blue"}], "orders": [[300, "Module 1", 1]]}]}
+
+Parameters:
+    layout          "plant" (PLC1 - PLC3b) or the path of a save file (.json / .dtb)
+    ticks           simulated ticks
+    orders          [[tick, module name, order], ...] placed by an in-process ERP once the module is free
+    conveyor_speed  Conveyer.speed_scale
+    spawner_stack   stack of every Spawner, e.g. [{"color": "blue"}]
+    ready           switch all modules to ready (default true)
+    skip_idle       jump over quiescent ticks (default true)
+    opc             run the OPC UA servers, one shared endpoint per scenario on port opc_port + index
+                    (default false: no servers, no port conflicts between the workers)
+"""
+from digitalTwin_base import World, Trigger
+from digitalTwin_Entities import Conveyer, Spawner, Stack, Stopper, PLC, PLC_OPCua
+from digitalTwin_Headless import HeadlessSimulation
+from digitalTwin_Metrics import percentile
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import time
+
+
+DEFAULTS = {"layout": "plant", "ticks": 5000, "orders": [], "conveyor_speed": 1, "spawner_stack": None,
+            "ready": True, "skip_idle": True, "vectorized_triggers": False, "opc": False, "opc_port": 4840}
+JAM_TICKS = 50  # a blocked Stack with a waiting follower that doesn't move for this long is jammed (see JamDetector)
+
+
+class OrderDriver:
+    """
+    The ERP side of the Start/Ack/Busy handshake in process (PLC_OPCua.set_input), one order at a time per module
+    Orders wait in their module queue until their tick has come and the module is free.
+    """
+    def __init__(self, plcs:list[PLC], orders:list):
+        self.modules:dict[str, PLC] = {x.name: x for x in plcs}
+        self.queues:dict[str, list] = {x: list() for x in self.modules}
+        for tick, module, order in sorted(orders, key=lambda x: x[0]):
+            self.queues[module].append((tick, order))
+        self.running:dict[str, tuple] = dict()  # module: (placed tick, state)
+        self.latencies:dict[str, list[int]] = {x: list() for x in self.modules}
+        self.placed:int = 0
+    
+    def is_done(self) -> bool:
+        return not self.running and not any(self.queues.values())
+    
+    def update(self, tick:int):
+        for name, plc in self.modules.items():
+            status = plc.status
+            running = self.running.get(name)
+            if running is None:
+                queue = self.queues[name]
+                if queue and queue[0][0] <= tick and status.ready and not status.busy:
+                    _, order = queue.pop(0)
+                    status.set_input("order", order)
+                    status.set_input("start", True)
+                    self.running[name] = (tick, 1)
+                    self.placed += 1
+            elif running[1] == 1 and status.ack:
+                status.set_input("start", False)
+                self.running[name] = (running[0], 2)
+            elif running[1] == 2 and not status.ack and not status.busy:
+                self.latencies[name].append(tick - running[0])
+                del self.running[name]
+
+
+class JamDetector:
+    """
+    Counts the Stacks that rest on a running belt for JAM_TICKS against a blocker while another Stack waits
+    behind them. A single Stack at a Wall or a belt end is just parked, Stacks queueing at a (chain to a)
+    Stopper wait for their order.
+    """
+    def __init__(self, conveyers:list[Conveyer]):
+        self.conveyers:list[Conveyer] = conveyers
+        self._resting:dict[Stack, list] = dict()  # Stack: [pos, ticks, counted]
+        self.jams:int = 0
+    
+    @staticmethod
+    def _waits_at_stopper(stack:Stack) -> bool:
+        seen = set()
+        blocker = stack._last_collider_cash
+        while isinstance(blocker, Stack) and blocker not in seen:  # queue behind other Stacks
+            seen.add(blocker)
+            blocker = blocker._last_collider_cash
+        return isinstance(blocker, Stopper)
+    
+    def update(self, ticks:int=1):
+        resting = dict()
+        for conveyer in self.conveyers:
+            if not conveyer.speed:
+                continue
+            for stack in conveyer.triggers[0]._present_entities:
+                entry = self._resting.get(stack)
+                if entry is None or entry[0] != stack.pos:
+                    entry = [stack.pos, 0, False]
+                entry[1] += ticks
+                resting[stack] = entry
+        followed = {x._last_collider_cash for x in resting}  # the blockers of the resting Stacks
+        for stack, entry in resting.items():
+            if (entry[1] >= JAM_TICKS and not entry[2] and stack in followed and stack._last_collider_cash is not None
+                    and not self._waits_at_stopper(stack)):
+                entry[2] = True
+                self.jams += 1
+        self._resting = resting
+
+
+def build_layout(world:World, layout:str) -> list[PLC]:
+    if layout == "plant":
+        from digitalTwin import create_plant
+        return create_plant(world)
+    if layout.endswith(".dtb"):
+        from digitalTwin_SaveFile import load_binary
+        load_binary(world, layout)
+    else:
+        with open(layout) as f:
+            world.load(json.load(f))
+    return list(PLC.instances)
+
+
+def run_scenario(params:dict, index:int=0) -> dict:
+    """Runs one parameter set (merged with DEFAULTS) and returns its KPIs, meant for a fresh process"""
+    params = {**DEFAULTS, **params}
+    PLC_OPCua.ENABLED = params["opc"]
+    if params["opc"]:
+        PLC_OPCua.SHARED_ENDPOINT = f"opc.tcp://localhost:{params['opc_port'] + index}"
+    Trigger.vectorized = params["vectorized_triggers"]
+    Conveyer.speed_scale = params["conveyor_speed"]
+    
+    t_start = time.perf_counter()
+    sim = HeadlessSimulation(skip_idle=params["skip_idle"])
+    plcs = build_layout(sim.world, params["layout"])
+    entities = sim.world._entities()
+    if params["spawner_stack"]:
+        for spawner in [x for x in entities if isinstance(x, Spawner)]:
+            spawner.stack = list(params["spawner_stack"])
+    if params["ready"]:
+        for plc in plcs:
+            plc.status.ready = True
+    driver = OrderDriver(plcs, params["orders"])
+    jams = JamDetector([x for x in entities if isinstance(x, Conveyer)])
+    t_setup = time.perf_counter()
+    
+    for tick in range(params["ticks"]):
+        driver.update(tick)
+        skipped = sim.skipped_ticks
+        sim.step()
+        if sim.skipped_ticks == skipped:  # nothing moves in a skipped tick
+            jams.update()
+    t_run = time.perf_counter() - t_setup
+    
+    latencies = [x for values in driver.latencies.values() for x in values]
+    result = {"name": params.get("name", str(index)), "index": index,
+              "ticks": sim.ticks, "skipped_ticks": sim.skipped_ticks,
+              "orders_placed": driver.placed, "orders_completed": len(latencies),
+              "orders_open": driver.placed - len(latencies) + sum([len(x) for x in driver.queues.values()]),
+              "completed_per_module": {k: len(v) for k, v in driver.latencies.items()},
+              "order_ticks_p50": percentile(latencies, 50), "order_ticks_max": max(latencies, default=None),
+              "jams": jams.jams,
+              "stacks": len([x for x in World.layers[0] if isinstance(x, Stack)]),
+              "setup_s": t_setup - t_start, "run_s": t_run, "ticks_per_s": sim.ticks / t_run if t_run else None}
+    sim.clear()
+    return result
+
+
+def sweep(scenarios:list[dict], defaults:dict=None, workers:int=None) -> list[dict]:
+    """Runs every scenario in its own process (World state is class level), results in scenario order"""
+    defaults = defaults if defaults else dict()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_scenario, {**defaults, **x}, i) for i, x in enumerate(scenarios)]
+        return [x.result() for x in futures]
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Runs the scenarios of a sweep file in a process pool")
+    parser.add_argument("scenarios", help="JSON file, see the module docstring")
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    parser.add_argument("--json", metavar="PATH", help="write the KPIs of all scenarios to PATH")
+    args = parser.parse_args()
+    
+    with open(args.scenarios) as f:
+        config = json.load(f)
+    scenarios = config.pop("scenarios", [dict()])
+    
+    t_start = time.perf_counter()
+    results = sweep(scenarios, defaults=config, workers=args.workers)
+    print(f"{len(results)} scenarios in {time.perf_counter() - t_start:.1f}s")
+    print(f"{'scenario':<20}{'ticks':>8}{'skipped':>9}{'orders':>8}{'done':>6}{'p50':>6}{'jams':>6}{'ticks/s':>10}")
+    for r in results:
+        p50 = r["order_ticks_p50"] if r["order_ticks_p50"] is not None else "-"
+        print(f"{r['name']:<20}{r['ticks']:>8}{r['skipped_ticks']:>9}{r['orders_placed']:>8}{r['orders_completed']:>6}{p50:>6}{r['jams']:>6}{r['ticks_per_s']:>10.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
@@ -1,13 +1,27 @@
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import typing
 import inspect
 from enum import Enum
-import tkinter as tk
 import math
 import time
+import heapq
+import itertools
 
+from digitalTwin_Metrics import METRICS, COSTS
 
-TIMINGS = dict()
+try:
+    import tkinter as tk
+except ImportError:  # headless installs without Tcl/Tk
+    tk = None
+
+try:
+    import numpy as np
+except ImportError:  # only needed for Trigger.vectorized
+    np = None
+
+
+TIMINGS = dict()  # time.perf_counter() timestamps of the last tick, see digitalTwin_Metrics for the statistics
 
 
 ENTITY_REGISTER = {}
@@ -16,23 +30,50 @@ def register_entity(cls):
     return cls
 
 
-@dataclass
+SAVE_FIELDS = {}
+def save_fields(cls) -> tuple[str]:
+    """The __init__ arguments of cls that are saved (inspect.signature is only called once per class)"""
+    fields = SAVE_FIELDS.get(cls)
+    if fields is None:
+        fields = SAVE_FIELDS[cls] = tuple(k for k in inspect.signature(cls.__init__).parameters.keys() if not k in ["self", "parent", "args", "kwargs"])
+    return fields
+
+
 class Vector:
-    x:float
-    y:float
+    """
+    2D vector, immutable by contract (nothing writes x/y after construction, the collider caches compare abs_pos
+    Vectors by identity and the cached length relies on it)
+    Slotted and without dataclass machinery, because thousands are created per tick
+    """
+    __slots__ = ("x", "y", "_length")  # _length stays unset until the first length
     
-    _length = None
-    
-    def __post_init__(self):
-        #self.x = round(self.x, 5)
-        #self.y = round(self.y, 5)
-        pass
+    def __init__(self, x:float, y:float):
+        self.x = x
+        self.y = y
     
+    # the hot operators skip type.__call__ and __init__
     def __add__(self, other) -> "Vector":
-        return Vector(self.x + other.x, self.y + other.y)
+        vector = _new_vector(Vector)
+        vector.x = self.x + other.x
+        vector.y = self.y + other.y
+        return vector
     
     def __sub__(self, other) -> "Vector":
-        return Vector(self.x - other.x, self.y - other.y)
+        vector = _new_vector(Vector)
+        vector.x = self.x - other.x
+        vector.y = self.y - other.y
+        return vector
+    
+    def __neg__(self) -> "Vector":
+        return Vector(-self.x, -self.y)
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Vector):
+            return self.x == other.x and self.y == other.y
+        return NotImplemented
+    
+    def __hash__(self):
+        return hash((self.x, self.y))
     
     def __repr__(self) -> str:
         return str((self.x, self.y))
@@ -42,7 +83,10 @@ class Vector:
     
     def __iter__(self):
         yield self.x
-        return self.y
+        yield self.y
+        
+    def __reduce__(self):
+        return (Vector, (self.x, self.y))
     
     @property
     def value(self) -> "Vector":
@@ -50,9 +94,22 @@ class Vector:
     
     @property
     def length(self) -> float:
-        if self._length is None:
-            self._length = math.sqrt(self.x**2 + self.y**2)
-        return self._length
+        try:
+            return self._length
+        except AttributeError:
+            self._length = length = math.sqrt(self.x*self.x + self.y*self.y)
+            return length
+    
+    @property
+    def length_sq(self) -> float:
+        """Squared length, avoids the sqrt for comparisons"""
+        return self.x*self.x + self.y*self.y
+    
+    def distance_sq(self, other:"Vector") -> float:
+        """Squared distance to other, without creating the difference Vector"""
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return dx*dx + dy*dy
     
     @property
     def angle(self) -> float:  
@@ -79,14 +136,12 @@ class Vector:
         return Vector(self.x/length, self.y/length)
     
     def __truediv__(self, other) -> "Vector":
-        if type(other) in [int, float]:
-            return Vector(self.x/other, self.y/other)
+        return Vector(self.x/other, self.y/other)
         
     def rotate(self, deg) -> "Vector":
         # deg = deg/180*math.pi
-        x = self.x * math.cos(deg) - math.sin(deg) * self.y
-        y = self.x * math.sin(deg) + math.cos(deg) * self.y
-        return Vector(x, y)
+        cos, sin = math.cos(deg), math.sin(deg)
+        return Vector(self.x * cos - sin * self.y, self.x * sin + cos * self.y)
     
     def __floordiv__(self, other):
         pass
@@ -96,13 +151,15 @@ class Vector:
         other [int/float] -> Vector
         other [Vector] -> float/int
         '''
-        if type(other) in [int, float]:
-            return Vector(self.x * other, self.y * other)
         if isinstance(other, Vector):
             return self.x * other.x + self.y * other.y
+        vector = _new_vector(Vector)
+        vector.x = self.x * other
+        vector.y = self.y * other
+        return vector
     
     def __rmul__(self, other):
-        return self.__mul__(other=other)
+        return self.__mul__(other)
     
     def __lt__(self, other) -> bool:
         if isinstance(other, Vector):
@@ -130,10 +187,15 @@ class Vector:
         
     def norm_box(self, size:"Vector") -> tuple["Vector", "Vector"]:
         """pos.norm_box(size) -> (pos:Vector, size:Vector)"""
-        size = self + size
-        pos1 = Vector(x=min(self.x, size.x), y=min(self.y, size.y))
-        pos2 = Vector(x=max(self.x, size.x), y=max(self.y, size.y))
-        return pos1, pos2-pos1
+        x1, y1 = self.x, self.y
+        x2, y2 = x1 + size.x, y1 + size.y
+        if x2 < x1:
+            x1, x2 = x2, x1
+        if y2 < y1:
+            y1, y2 = y2, y1
+        return Vector(x1, y1), Vector(x2 - x1, y2 - y1)
+
+_new_vector = object.__new__
 
 
 class Orientation(Enum):
@@ -146,7 +208,10 @@ class Orientation(Enum):
 @register_entity
 class Entity:
     dont_save = False
+    save_children = True  # False if __init__ builds the children itself
+    built_by:"Entity" = None  # the Entity that builds this one as its sibling (PLC._init_sim), not saved but part of the layout
     add_to_layers = True
+    snapshot_exclude = frozenset(("_abs", "_abs_dirty", "_hash"))  # derived, rebuilt by World.restore
     
     def __init__(self, parent:"Entity", pos:Vector, layer:int=0, collisions_enabled:bool=False):
         self.parent:Entity = parent
@@ -155,12 +220,13 @@ class Entity:
         self.collisions_enabled:bool = collisions_enabled
         
         self._hash = None
+        self._abs_dirty:bool = False  # abs_pos is recomputed on the next read
         
         self.__post_init__()
         self._update_abs_pos()
     
     def __post_init__(self):
-        self.abs_pos = self.parent.abs_pos + self._pos
+        self._abs = self.parent.abs_pos + self._pos
         
         self.children:list[Entity] = list()
         self.colliders:list[AABB_Collider | Sphere_Collider] = list()
@@ -171,6 +237,7 @@ class Entity:
         self.parent.children.append(self)
         if self.add_to_layers:
             World.layers[self.layer].append(self)
+        World.activity += 1
         
     @property
     def pos(self):
@@ -180,12 +247,31 @@ class Entity:
     def pos(self, value:Vector):
         self._pos = value
         self._update_abs_pos()
+        World.activity += 1
+    
+    @property
+    def abs_pos(self) -> Vector:
+        if self._abs_dirty:
+            self._abs = self.parent.abs_pos + self._pos
+            self._abs_dirty = False
+        return self._abs
     
     def _update_abs_pos(self):
-        self.abs_pos = self.parent.abs_pos + self._pos
-        [x._update_abs_pos() for x in self.children] # DEBUG
-        for x in self.colliders:
-            x.abs_pos = self.abs_pos + x._pos
+        if not self._abs_dirty:
+            self._invalidate_abs_pos()
+    
+    def _invalidate_abs_pos(self):
+        """
+        Marks the abs_pos of the Entity and its subtree as stale, nothing is computed until someone reads it
+        (a dirty Entity always has a dirty subtree, so the walk stops at dirty children)
+        Colliders follow the abs_pos of their parent on their own, the grid re-sorts stale Entities before a query
+        """
+        self._abs_dirty = True
+        if self.add_to_layers and self.colliders:
+            World.grid.mark_stale(self)
+        for x in self.children:
+            if not x._abs_dirty:
+                x._invalidate_abs_pos()
         
     @property
     def _abs_pos(self) -> Vector:
@@ -196,6 +282,8 @@ class Entity:
             World.layers[self.layer].remove(self)
             self.layer = new_layer
             World.layers[self.layer].append(self)
+            World.grid.update(self)
+            World.activity += 1
     
     def change_parent(self, new_parent:"Entity"):
         self._pos = self.abs_pos - new_parent.abs_pos
@@ -204,6 +292,7 @@ class Entity:
         self.parent.children.append(self)
         self._update_abs_pos()
         self.update()
+        World.activity += 1
     
     def update(self):
         World.updates.add(self)
@@ -211,7 +300,14 @@ class Entity:
     def _update(self):
         [x._update() for x in self.children]
         [x.render() for x in self.renders]
-        
+    
+    def is_idle(self) -> bool:
+        """False while the Entity changes the world on its own (animations), see World.update_quiescence"""
+        return True
+    
+    def _after_restore(self):
+        """Called by World.restore once the state of all Entities is back"""
+        self.update()
     
     def collision_check(self, other:"Entity", ignore=tuple()):
         if not(self.collisions_enabled and other.collisions_enabled):
@@ -232,7 +328,9 @@ class Entity:
         [x.remove() for x in list(self.triggers)]
         if self in World.layers[self.layer]:
             World.layers[self.layer].remove(self)
+        World.grid.remove(self)
         self.parent.children.remove(self)
+        World.activity += 1
         
     def raise_to_top(self):
         [x.raise_to_top() for x in self.renders]
@@ -242,6 +340,16 @@ class Entity:
         [x.lower_to_bottom() for x in self.children]
         [x.lower_to_bottom() for x in self.renders]
     
+    def get_bounds(self) -> tuple[Vector, Vector] | None:
+        """(min:Vector, max:Vector) of all colliders, None if the Entity has no colliders"""
+        bounds = [x.get_bounds() for x in self.colliders]
+        if not bounds:
+            return None
+        if len(bounds) == 1:
+            return bounds[0]
+        return (Vector(min(b[0].x for b in bounds), min(b[0].y for b in bounds)),
+                Vector(max(b[1].x for b in bounds), max(b[1].y for b in bounds)))
+    
     def __contains__(self, other):
         # TODO: Implement rough checks
         # Entity in Entity checking can be expensive, avoid if possible
@@ -262,14 +370,15 @@ class Entity:
     
     # the _to_json / _from_json functions recursively traverse the parent/child structure of the world/save-file
     # to save/load all Entities to exclude a type of Entity from being saved set the class variable "dont_save = True"
+    # (or "save_children = False" to exclude the children of an Entity that creates them on its own)
     def _to_json(self):
         # for this to work all arguments of __init__ have to be assigned to self under the same name
         # example __init__(self, name:str)  ==>  self.name = name
         # otherwise the the save function has no way of knowing how to fill name variable for loading
         # alternatively one can override the _to_json function and assign values by hand
         return {"type": self.__class__.__name__, 
-                "kwargs": {k:self.__getattribute__(k) for k in inspect.signature(self.__class__.__init__).parameters.keys() if not k in ["self", "parent", "args", "kwargs"]},
-                "children": [x._to_json() for x in self.children if not x.dont_save]
+                "kwargs": {k:self.__getattribute__(k) for k in save_fields(self.__class__)},
+                "children": [x._to_json() for x in self.children if not x.dont_save] if self.save_children else []
                 }
         
     @classmethod
@@ -289,7 +398,7 @@ class Entity:
 class RenderContainer:    
     parent:Entity
     pos:Vector
-    canvas_id:int | tk.Frame
+    canvas_id:"int | tk.Frame"
     
     def __post_init__(self):
         self.parent.renders.append(self)
@@ -299,7 +408,7 @@ class RenderContainer:
         pos1 = parent.abs_pos + pos
         return cls(parent=parent, 
                    pos=pos,
-                   canvas_id=World.instance.canvas.create_text(pos1.x, pos1.y, text=text, *args, **kwargs))
+                   canvas_id=World.instance.backend.create_text(pos1.x, pos1.y, text=text, *args, **kwargs))
     
     @classmethod
     def create_rectangle(cls, parent:Entity, pos:Vector, size:Vector, *args, **kwargs):
@@ -308,7 +417,7 @@ class RenderContainer:
         pos2 = pos1 + size
         return cls(parent=parent, 
                    pos=pos,
-                   canvas_id=World.instance.canvas.create_rectangle(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
+                   canvas_id=World.instance.backend.create_rectangle(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
 
     @classmethod
     def create_line(cls, parent:Entity, pos:Vector, size:Vector, *args, **kwargs):
@@ -317,7 +426,7 @@ class RenderContainer:
         pos2 = pos1 + size
         return cls(parent=parent, 
                    pos=pos,
-                   canvas_id=World.instance.canvas.create_line(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
+                   canvas_id=World.instance.backend.create_line(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
         
     @classmethod
     def create_oval(cls, parent:Entity, pos:Vector, size:Vector, *args, **kwargs):
@@ -326,7 +435,7 @@ class RenderContainer:
         pos2 = pos1 + size
         return cls(parent=parent, 
                    pos=pos,
-                   canvas_id=World.instance.canvas.create_oval(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
+                   canvas_id=World.instance.backend.create_oval(pos1.x, pos1.y, pos2.x, pos2.y, *args, **kwargs))
     
     @classmethod
     def create_window(cls, parent:Entity, pos:Vector, tk_element, *args, **kwargs):
@@ -334,7 +443,7 @@ class RenderContainer:
         kwargs.setdefault("anchor", "nw")
         return cls(parent=parent,
                    pos=pos,
-                   canvas_id=World.instance.canvas.create_window(pos1.x, pos1.y, window=tk_element, *args, **kwargs))
+                   canvas_id=World.instance.backend.create_window(pos1.x, pos1.y, window=tk_element, *args, **kwargs))
     
     @property
     def abs_pos(self) -> Vector:
@@ -357,36 +466,216 @@ class RenderContainer:
         
     def raise_to_top(self):
         if isinstance(self.canvas_id, int):
-            World.instance.canvas.tag_raise(self.canvas_id)
+            World.instance.backend.tag_raise(self.canvas_id)
         else:
             pass
         
     def lower_to_bottom(self):
         if isinstance(self.canvas_id, int):
-            World.instance.canvas.tag_lower(self.canvas_id)
+            World.instance.backend.tag_lower(self.canvas_id)
         
     def _render(self):
         pos = self.abs_pos
         if isinstance(self.canvas_id, int):
-            World.instance.canvas.moveto(self.canvas_id, pos.x, pos.y)
+            World.instance.backend.moveto(self.canvas_id, pos.x, pos.y)
         else:
             self.canvas_id.place(x=pos.x, y=pos.y)
         
     def remove(self):
         if isinstance(self.canvas_id, int):
-            World.instance.canvas.delete(self.canvas_id)
+            World.instance.backend.delete(self.canvas_id)
         else:
             self.canvas_id.destroy()
+        World.renders.discard(self)  # can still be queued if rendering is deferred over several ticks
         self.parent.renders.remove(self)
         self.parent = None
         
     def set_color(self, color:str):
         if isinstance(self.canvas_id, int):
-            World.instance.canvas.itemconfig(self.canvas_id, fill=color)
+            World.instance.backend.itemconfig(self.canvas_id, fill=color)
         else:
             self.canvas_id.config(bg=color)
 
 
+class RenderBackend(ABC):
+    """
+    Interface between the RenderContainers and whatever draws them
+    Canvas items are referenced by their int id, embedded tk widgets (create_window) are handled by the RenderContainer
+    A backend that misses one of the abstract methods fails when it is created, not in the middle of a tick
+    """
+    canvas = None
+    
+    @abstractmethod
+    def create_text(self, x, y, *args, **kwargs) -> int:
+        ...
+    
+    @abstractmethod
+    def create_rectangle(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        ...
+    
+    @abstractmethod
+    def create_line(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        ...
+    
+    @abstractmethod
+    def create_oval(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        ...
+    
+    @abstractmethod
+    def create_window(self, x, y, *args, **kwargs) -> int:
+        ...
+    
+    @abstractmethod
+    def moveto(self, item:int, x, y):
+        ...
+    
+    @abstractmethod
+    def itemconfig(self, item:int, **kwargs):
+        ...
+    
+    @abstractmethod
+    def tag_raise(self, item:int):
+        ...
+    
+    @abstractmethod
+    def tag_lower(self, item:int):
+        ...
+    
+    @abstractmethod
+    def delete(self, item:int):
+        ...
+    
+    def flush(self):
+        """Called once per frame after all RenderContainers are rendered"""
+        pass
+
+
+class TkRenderBackend(RenderBackend):
+    """
+    Draws on a tk.Canvas
+    batched=True: moveto and fill changes are diffed against the last values sent for each item,
+    everything that actually changed is sent to Tcl in one script by flush() (once per frame)
+    batched=False: every call is a Tcl round trip
+    """
+    def __init__(self, canvas:"tk.Canvas", batched:bool=True):
+        self.canvas:tk.Canvas = canvas
+        self.batched:bool = batched
+        
+        self._sent_pos:dict[int, tuple] = dict()
+        self._sent_fill:dict[int, str] = dict()
+        self._pending_pos:dict[int, tuple] = dict()
+        self._pending_fill:dict[int, str] = dict()
+    
+    def create_text(self, x, y, *args, **kwargs) -> int:
+        return self.canvas.create_text(x, y, *args, **kwargs)
+    
+    def create_rectangle(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self.canvas.create_rectangle(x1, y1, x2, y2, *args, **kwargs)
+    
+    def create_line(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self.canvas.create_line(x1, y1, x2, y2, *args, **kwargs)
+    
+    def create_oval(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self.canvas.create_oval(x1, y1, x2, y2, *args, **kwargs)
+    
+    def create_window(self, x, y, *args, **kwargs) -> int:
+        return self.canvas.create_window(x, y, *args, **kwargs)
+    
+    def moveto(self, item:int, x, y):
+        if not self.batched:
+            self.canvas.moveto(item, x, y)
+            return
+        if self._sent_pos.get(item) == (x, y):
+            self._pending_pos.pop(item, None)  # moved back within the frame
+        else:
+            self._pending_pos[item] = (x, y)
+        
+    def itemconfig(self, item:int, **kwargs):
+        if not self.batched or len(kwargs) != 1 or "fill" not in kwargs:
+            self.canvas.itemconfig(item, **kwargs)
+            self._sent_fill.pop(item, None)  # unknown state after a direct configure
+            return
+        if self._sent_fill.get(item) == kwargs["fill"]:
+            self._pending_fill.pop(item, None)
+        else:
+            self._pending_fill[item] = kwargs["fill"]
+        
+    def tag_raise(self, item:int):
+        self.canvas.tag_raise(item)
+        
+    def tag_lower(self, item:int):
+        self.canvas.tag_lower(item)
+        
+    def delete(self, item:int):
+        for x in (self._sent_pos, self._sent_fill, self._pending_pos, self._pending_fill):
+            x.pop(item, None)
+        self.canvas.delete(item)
+        
+    def flush(self):
+        if not (self._pending_pos or self._pending_fill):
+            return
+        path = self.canvas._w
+        script = [f"{path} moveto {item} {x!r} {y!r}" for item, (x, y) in self._pending_pos.items()]
+        script += [f"{path} itemconfigure {item} -fill {{{fill}}}" for item, fill in self._pending_fill.items()]
+        self.canvas.tk.eval("\n".join(script))
+        self._sent_pos.update(self._pending_pos)
+        self._sent_fill.update(self._pending_fill)
+        self._pending_pos.clear()
+        self._pending_fill.clear()
+
+
+class HeadlessRenderBackend(RenderBackend):
+    """
+    Render backend without a display
+    record=False: every call is a no-op, only item ids are handed out
+    record=True: the last position and options of every item are kept in self.items (debugging/testing)
+    """
+    def __init__(self, record:bool=False):
+        self.record:bool = record
+        self.items:dict[int, dict] = dict()
+        self._item_count:int = 0
+        
+    def _create(self, item_type:str, coords:tuple, kwargs:dict) -> int:
+        self._item_count += 1
+        if self.record:
+            self.items[self._item_count] = {"type": item_type, 
+                                            "pos": (min(coords[0::2]), min(coords[1::2])),
+                                            "options": dict(kwargs)}
+        return self._item_count
+    
+    def create_text(self, x, y, *args, **kwargs) -> int:
+        return self._create("text", (x, y), kwargs)
+    
+    def create_rectangle(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self._create("rectangle", (x1, y1, x2, y2), kwargs)
+    
+    def create_line(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self._create("line", (x1, y1, x2, y2), kwargs)
+    
+    def create_oval(self, x1, y1, x2, y2, *args, **kwargs) -> int:
+        return self._create("oval", (x1, y1, x2, y2), kwargs)
+    
+    def create_window(self, x, y, *args, **kwargs) -> int:
+        return self._create("window", (x, y), kwargs)
+    
+    def moveto(self, item:int, x, y):
+        if self.record:
+            self.items[item]["pos"] = (x, y)
+        
+    def itemconfig(self, item:int, **kwargs):
+        if self.record:
+            self.items[item]["options"].update(kwargs)
+        
+    def tag_raise(self, item:int):
+        pass
+        
+    def tag_lower(self, item:int):
+        pass
+        
+    def delete(self, item:int):
+        self.items.pop(item, None)
+
+
 def collider_helper(sc: "Sphere_Collider", aabb: "AABB_Collider") -> bool:
     def check(pn, b_min, b_max):
         out = 0
@@ -413,8 +702,10 @@ class AABB_Collider:  # Axes Aligned Boundary Box
     
     def __post_init__(self):
         self.parent.colliders.append(self)
-        self._abs_pos = self.parent.abs_pos + self._pos
+        self._abs_src:Vector = None  # parent.abs_pos the cached abs_pos/box belong to
+        self._abs_pos:Vector = None
         self._norm_box = None
+        World.grid.update_collider(self)
         
     @property
     def pos(self):
@@ -423,27 +714,32 @@ class AABB_Collider:  # Axes Aligned Boundary Box
     @pos.setter
     def pos(self, value:Vector):
         self._pos = value
-        self.abs_pos = self.parent.abs_pos + self._pos
-        self._norm_box = None  # invalidate box cash on pos change
+        self._abs_src = None  # invalidate abs_pos and box cash on pos change
+        World.grid.update_collider(self)
     
     @property
     def abs_pos(self):
+        parent_abs = self.parent.abs_pos
+        if parent_abs is not self._abs_src:  # Vectors are immutable, a new object means the parent moved
+            self._abs_src = parent_abs
+            self._abs_pos = parent_abs + self._pos
+            self._norm_box = None
         return self._abs_pos
-    
-    @abs_pos.setter
-    def abs_pos(self, value):
-        self._abs_pos = value
-        self._norm_box = None  # invalidate box cash on abs_pos change
         
     def get_box(self):  # cashing this call dramatically improves performance
+        abs_pos = self.abs_pos
         if self._norm_box:
             return self._norm_box
-        pos1, size = (self.parent.abs_pos + self._pos).norm_box(self.size)
+        pos1, size = abs_pos.norm_box(self.size)
         self._norm_box = (pos1, pos1+size)
         return self._norm_box
     
+    def get_bounds(self) -> tuple[Vector, Vector]:
+        return self.get_box()
+    
     def remove(self):
         self.parent.colliders.remove(self)
+        World.grid.update_collider(self)
         self.parent = None
     
     def __contains__(self, other) -> bool:
@@ -476,7 +772,9 @@ class Sphere_Collider:  # Sphere collider
     
     def __post_init__(self):
         self.parent.colliders.append(self)
-        self.abs_pos = self.parent.abs_pos + self._pos
+        self._abs_src:Vector = None  # parent.abs_pos the cached abs_pos belongs to
+        self._abs_pos:Vector = None
+        World.grid.update_collider(self)
         
     @property
     def pos(self):
@@ -485,15 +783,30 @@ class Sphere_Collider:  # Sphere collider
     @pos.setter
     def pos(self, value:Vector):
         self._pos = value
-        self.abs_pos = self.parent.abs_pos + self._pos
+        self._abs_src = None
+        World.grid.update_collider(self)
+        
+    @property
+    def abs_pos(self):
+        parent_abs = self.parent.abs_pos
+        if parent_abs is not self._abs_src:  # Vectors are immutable, a new object means the parent moved
+            self._abs_src = parent_abs
+            self._abs_pos = parent_abs + self._pos
+        return self._abs_pos
+        
+    def get_bounds(self) -> tuple[Vector, Vector]:
+        pos, radius = self.abs_pos, self.radius
+        return Vector(pos.x - radius, pos.y - radius), Vector(pos.x + radius, pos.y + radius)
         
     def remove(self):
         self.parent.colliders.remove(self)
+        World.grid.update_collider(self)
         self.parent = None
     
     def __contains__(self, other) -> bool:
         if isinstance(other, Sphere_Collider):
-            return (self.abs_pos - other.abs_pos).length < self.radius + other.radius
+            radius = self.radius + other.radius
+            return self.abs_pos.distance_sq(other.abs_pos) < radius * radius
         elif isinstance(other, AABB_Collider):
             return collider_helper(sc=self, aabb=other)
         elif isinstance(other, Entity):
@@ -501,6 +814,9 @@ class Sphere_Collider:  # Sphere collider
             return self in other
     
     
+EMPTY_SET = frozenset()
+
+
 class TriggerTypes(Enum):
     PRESENT = 0
     ENTER = 1
@@ -511,6 +827,8 @@ class TriggerTypes(Enum):
 @dataclass
 class Trigger:
     instances:typing.ClassVar[list["Trigger"]] = list()
+    vectorized:typing.ClassVar[bool] = False  # evaluate AABB Triggers in one NumPy pass (see check_all)
+    VECTORIZE_MIN_GROUP:typing.ClassVar[int] = 32  # smaller check_groups are faster in python
     
     parent:Entity
     collider:AABB_Collider | Sphere_Collider
@@ -521,6 +839,7 @@ class Trigger:
         self.pos = Vector(0,0)
         self.check_types = self.check_types if self.check_types else (Entity,)
         self._triggers = {x:list() for x in TriggerTypes}
+        self._batch_triggers = list()  # func(present, enter, exit), see register_batch
         self._present_entities = set()  # Caution can contain a ref to a removed Entity that will trigger an EXIT event
                 
         self.parent.triggers.append(self)
@@ -533,6 +852,14 @@ class Trigger:
     def register(self, type:TriggerTypes, func):
         self._triggers.get(type, []).append(func)
     
+    def register_batch(self, func):
+        """
+        func(present, enter, exit) gets the entity sets of a tick in one event instead of one event per entity,
+        queued in place of the PRESENT events while anything is present or has exited
+        The sets belong to the Trigger: read them, don't keep or change them.
+        """
+        self._batch_triggers.append(func)
+    
     def __str__(self):
         return f"<{str(self.__class__).strip('<>')} object at {hex(id(self))}>"
     
@@ -543,6 +870,9 @@ class Trigger:
         pass
         
     def check(self):
+        self._set_present_entities(self._get_present_entities())
+        
+    def _get_present_entities(self) -> set[Entity]:
         collider = self.collider
         present_entities = set()
         for entity in self.check_group:
@@ -550,78 +880,528 @@ class Trigger:
                 continue
             if entity in collider:
                 present_entities.add(entity)
-                
-        exit_entities = self._present_entities.difference(present_entities)
-        enter_entities = present_entities.difference(self._present_entities)
+        return present_entities
+    
+    def _set_present_entities(self, present_entities:set[Entity]):
+        """Compares the new present_entities with the last check and queues the trigger events"""
+        last_entities = self._present_entities
+        if present_entities == last_entities:  # the common case of a busy belt, nothing entered or left
+            exit_entities = enter_entities = EMPTY_SET
+            present_entities = last_entities
+        else:
+            exit_entities = last_entities.difference(present_entities)
+            enter_entities = present_entities.difference(last_entities)
         
-        occupancy_change = bool(self._present_entities) != bool(present_entities)
+        occupancy_change = bool(last_entities) != bool(present_entities)
         self._present_entities = present_entities
+        if enter_entities or exit_entities:
+            World.activity += 1
         if occupancy_change:
-            [list(World.enqueue_event(func=func, args=(bool(present_entities),)) for func in self._triggers.get(TriggerTypes.OCCUPANCY))]
-        [list(map(lambda e: World.enqueue_event(func=func, args=(e,)), present_entities)) for func in self._triggers.get(TriggerTypes.PRESENT)]
-        [list(map(lambda e: World.enqueue_event(func=func, args=(e,)), enter_entities)) for func in self._triggers.get(TriggerTypes.ENTER)]
-        [list(map(lambda e: World.enqueue_event(func=func, args=(e,)), exit_entities)) for func in self._triggers.get(TriggerTypes.EXIT)]
+            [list(World.enqueue_event(func=func, args=(bool(present_entities),), owner=self.parent) for func in self._triggers.get(TriggerTypes.OCCUPANCY))]
+        if self._batch_triggers and (present_entities or exit_entities):
+            [World.enqueue_event(func=func, args=(present_entities, enter_entities, exit_entities), owner=self.parent) for func in self._batch_triggers]
+        [list(map(lambda e: World.enqueue_event(func=func, args=(e,), owner=self.parent), present_entities)) for func in self._triggers.get(TriggerTypes.PRESENT)]
+        [list(map(lambda e: World.enqueue_event(func=func, args=(e,), owner=self.parent), enter_entities)) for func in self._triggers.get(TriggerTypes.ENTER)]
+        [list(map(lambda e: World.enqueue_event(func=func, args=(e,), owner=self.parent), exit_entities)) for func in self._triggers.get(TriggerTypes.EXIT)]
+    
+    @classmethod
+    def check_all(cls):
+        """
+        Checks all Trigger instances
+        With Trigger.vectorized (and NumPy installed) the AABB Triggers sharing a check_group are tested 
+        against all Entities of that group with exactly one Sphere_Collider (Stacks) in one NumPy pass.
+        Every other combination falls back to the python check, so the trigger events stay the same.
+        Groups below VECTORIZE_MIN_GROUP Entities use the python check as well: the NumPy setup costs more than it
+        saves there (one Trigger: 44µs python vs 53µs NumPy at 20 Entities, crossover at about 30, 86µs vs 69µs at 40).
+        """
+        if not cls.vectorized or np is None:
+            [x.check() for x in cls.instances]
+            return
+        
+        instances = list(cls.instances)
+        results:list[set] = [None] * len(instances)
+        groups:dict[int, list[int]] = dict()  # id(check_group) -> indices of the Triggers using it
+        for i, trigger in enumerate(instances):
+            if isinstance(trigger.collider, AABB_Collider) and len(trigger.check_group) >= cls.VECTORIZE_MIN_GROUP:
+                groups.setdefault(id(trigger.check_group), list()).append(i)
+            else:
+                results[i] = trigger._get_present_entities()
+                
+        for indices in groups.values():
+            group = list(instances[indices[0]].check_group)
+            
+            # pack the candidates
+            sphere_idx, other_idx = list(), list()
+            xs, ys, rs = list(), list(), list()
+            for j, entity in enumerate(group):
+                colliders = entity.colliders
+                if len(colliders) == 1 and type(colliders[0]) is Sphere_Collider:
+                    sc = colliders[0]
+                    sphere_idx.append(j)
+                    xs.append(sc.abs_pos.x)
+                    ys.append(sc.abs_pos.y)
+                    rs.append(sc.radius)
+                else:
+                    other_idx.append(j)
+            
+            # pack the trigger boxes
+            boxes = [instances[i].collider.get_box() for i in indices]
+            x1 = np.array([b[0].x for b in boxes])[:, None]
+            y1 = np.array([b[0].y for b in boxes])[:, None]
+            x2 = np.array([b[1].x for b in boxes])[:, None]
+            y2 = np.array([b[1].y for b in boxes])[:, None]
+            
+            # overlap matrix [trigger, entity], same math as collider_helper
+            hits = np.zeros((len(indices), len(group)), dtype=bool)
+            if sphere_idx:
+                px, py, r = np.array(xs), np.array(ys), np.array(rs)
+                dx = np.maximum(x1 - px, 0) + np.maximum(px - x2, 0)
+                dy = np.maximum(y1 - py, 0) + np.maximum(py - y2, 0)
+                hits[:, sphere_idx] = dx*dx + dy*dy <= r*r
+            
+            type_masks = dict()
+            for row, i in enumerate(indices):
+                trigger = instances[i]
+                check_types = trigger.check_types
+                if check_types not in type_masks:
+                    type_masks[check_types] = np.array([isinstance(x, check_types) for x in group], dtype=bool)
+                mask = type_masks[check_types]
+                for j in other_idx:
+                    if mask[j]:
+                        hits[row, j] = group[j] in trigger.collider
+                # ascending indices keep the insertion order of Trigger.check
+                results[i] = {group[j] for j in np.flatnonzero(hits[row] & mask)}
+                
+        for trigger, present_entities in zip(instances, results):
+            trigger._set_present_entities(present_entities)
     
     def is_occupied(self):
         return bool(self._present_entities)
     
     def remove(self):
-        self.parent.triggers.remove(self)
-        self.instances.remove(self)
+        # by identity, list.remove would take the first Trigger that is only equal (dataclass __eq__)
+        for triggers in (self.parent.triggers, self.instances):
+            del triggers[next(i for i, x in enumerate(triggers) if x is self)]
         self._present_entities = None
         self.parent = None
         
 
+class WorldSnapshot:
+    """
+    In memory state of a World, see World.snapshot / World.restore
+    Attributes are captured one level deep: lists, sets and dicts are copied and refilled in place on restore
+    (Trigger.check_group aliases World.layers or Spawner.spawned), everything else is kept by reference
+    (Vectors are immutable). A snapshot can be restored any number of times.
+    """
+    def __init__(self):
+        self.entities:dict[Entity, list[tuple]] = dict()
+        self.triggers:dict[Trigger, list[tuple]] = dict()
+        self.renders:list[tuple[RenderContainer, Vector]] = list()
+        self.lists:list[tuple[list, list]] = list()
+        self.events:list = list()
+        self.updates:set = set()
+        self.tick_counts:dict = dict()
+        self.tick:int = 0
+        self.sleeping_animations:set = set()
+        self.timers:list[tuple[Timer, bool]] = list()
+    
+    @staticmethod
+    def capture(obj, exclude=frozenset()) -> list[tuple]:
+        """[(name, value, copy of the items or None)]"""
+        state = list()
+        for name, value in obj.__dict__.items():
+            if name in exclude:
+                continue
+            value_type = type(value)
+            if value_type is list or value_type is set or value_type is dict:
+                state.append((name, value, value.copy()))
+            else:
+                state.append((name, value, None))
+        return state
+    
+    @staticmethod
+    def apply(obj, state:list[tuple]):
+        attributes = obj.__dict__  # bypasses the property setters (e.g. Conveyer.speed)
+        for name, value, items in state:
+            if items is not None:
+                value.clear()
+                if type(value) is list:
+                    value.extend(items)
+                else:
+                    value.update(items)
+            attributes[name] = value
+
+
+class SpatialHash:
+    """
+    Uniform grid over all Entities in World.layers, cells are keyed by (layer, cell_x, cell_y)
+    An Entity is listed in every cell its collider bounds overlap, so collision checks 
+    only have to look at the Entities around a position instead of the whole layer
+    """
+    CELL_SIZE = 32  # a bit larger than a Stack
+    
+    def __init__(self, cell_size:float=CELL_SIZE):
+        self.cell_size:float = cell_size
+        self._cells:dict[tuple, dict[Entity, None]] = dict()  # dict as insertion ordered set
+        self._entity_cells:dict[Entity, tuple] = dict()
+        self._stale:dict[Entity, None] = dict()  # moved Entities, re-sorted before the next query
+        
+    def _cell_keys(self, layer:int, pos1:Vector, pos2:Vector) -> tuple:
+        cs = self.cell_size
+        return tuple((layer, x, y) for x in range(math.floor(pos1.x / cs), math.floor(pos2.x / cs) + 1) 
+                                   for y in range(math.floor(pos1.y / cs), math.floor(pos2.y / cs) + 1))
+        
+    def update(self, entity:Entity):
+        """(Re)sorts an Entity into the cells of its current bounds"""
+        bounds = entity.get_bounds()
+        cells = self._cell_keys(entity.layer, *bounds) if bounds else tuple()
+        old_cells = self._entity_cells.get(entity, tuple())
+        if cells == old_cells:
+            return
+        for cell in old_cells:
+            entities = self._cells[cell]
+            del entities[entity]
+            if not entities:
+                del self._cells[cell]
+        for cell in cells:
+            self._cells.setdefault(cell, dict())[entity] = None
+        if cells:
+            self._entity_cells[entity] = cells
+        else:
+            self._entity_cells.pop(entity, None)
+            
+    def mark_stale(self, entity:Entity):
+        self._stale[entity] = None
+        
+    def flush(self):
+        while self._stale:
+            stale, self._stale = self._stale, dict()
+            [self.update(x) for x in stale]
+            
+    def update_collider(self, collider:"AABB_Collider | Sphere_Collider"):
+        """Adding, moving or removing a collider changes the bounds of its parent"""
+        if collider.parent.add_to_layers:
+            self.update(collider.parent)
+    
+    def remove(self, entity:Entity):
+        self._stale.pop(entity, None)
+        for cell in self._entity_cells.pop(entity, tuple()):
+            entities = self._cells[cell]
+            del entities[entity]
+            if not entities:
+                del self._cells[cell]
+                
+    def query(self, layer:int, pos1:Vector, pos2:Vector) -> dict[Entity, None]:
+        """All Entities of a layer that overlap a cell of the box pos1 (min) - pos2 (max)"""
+        if self._stale:
+            self.flush()
+        found = dict()
+        cells = self._cells
+        for cell in self._cell_keys(layer, pos1, pos2):
+            entities = cells.get(cell)
+            if entities:
+                found.update(entities)
+        return found
+    
+    def clear(self):
+        self._cells.clear()
+        self._entity_cells.clear()
+        self._stale.clear()
+
+
+class Timer:
+    """A call scheduled with World.schedule_at / World.schedule_in, cancel() drops it before it is due"""
+    def __init__(self, tick:int, seq:int, func, args:tuple, kwargs:dict, owner:Entity):
+        self.tick:int = tick
+        self.seq:int = seq
+        self.func = func
+        self.args:tuple = args
+        self.kwargs:dict = kwargs
+        self.owner:Entity = owner
+        self.cancelled:bool = False
+    
+    def __lt__(self, other:"Timer") -> bool:
+        return (self.tick, self.seq) < (other.tick, other.seq)
+    
+    def cancel(self):
+        self.cancelled = True
+
+
 class World:
     instance:"World" = None
     
-    animations:list = list()
+    animations:list = list()  # awake animations, called every tick
+    sleeping_animations:set = set()  # see sleep_animation / wake_animation
+    _animations_dirty:bool = False
     layers:dict[int, list[Entity]] = [list(), list(), list()]  # [0 = No collisions, 1 = bottom layer, 1+ = picked layers]
+    grid:SpatialHash = SpatialHash()  # spatial index of the Entities in layers
     
     events:list = list()
     updates:set[Entity] = set()
     renders:set[RenderContainer] = set()
+    tick_counts:dict[str, int] = {"events": 0, "updates": 0}  # of the last tick
+    
+    # timers: calls scheduled for a later tick, they wait in a heap instead of being polled every tick
+    # (no Entity of the plant schedules anything yet, the PLC programs react to Triggers and sensors)
+    tick:int = 0  # the tick simulated next, skipped quiescent ticks included
+    timers:list[Timer] = list()  # heap, cancelled Timers are dropped when they come up
+    _timer_seq = itertools.count()
+    
+    # quiescence: a tick without activity while all animations are idle can't change anything until an external input arrives
+    QUIESCENT_TICKS = 2  # quiet ticks in a row before the world counts as quiescent
+    activity:int = 0  # incremented by every change (Entity moved/created/removed, Trigger enter/exit, speeds, OPC handshake)
+    quiet_ticks:int = 0
+    quiet_activity:int = 0  # World.activity at the end of the last tick
     
-    def __init__(self, canvas):
+    def __init__(self, canvas:"tk.Canvas"=None, backend:RenderBackend=None):
+        # without a canvas the world runs headless (no display, no Tcl round trips)
         self.canvas:tk.Canvas = canvas
+        if backend is None:
+            backend = TkRenderBackend(canvas) if canvas is not None else HeadlessRenderBackend()
+        self.backend:RenderBackend = backend
         self._canvas_layers = list() 
         self.parent:"Entity" = None
         self.pos:Vector = Vector(0,0)
         self.children:list[Entity] = list()        
         
         self.__class__.instance = self
+        self.__class__.tick = 0
+        self.__class__.timers = list()
     
     @staticmethod
-    def update_world():
-        [x.check() for x in Trigger.instances]  # check Triggers and queue trigger events
-        TIMINGS["t_trigger"] = time.process_time()
+    def update_world(render:bool=True):
+        """One simulation tick, render=False leaves the render calls queued for a later World.render_world()"""
+        Trigger.check_all()  # check Triggers and queue trigger events
+        if World.timers and World.timers[0].tick <= World.tick:
+            World._enqueue_due_timers()  # due timers run after the trigger events of the tick
+        TIMINGS["t_trigger"] = time.perf_counter()
         # [x._update() for x in self.children]
-        [x[0](*x[1], **x[2]) for x in World.events]  # execute queued trigger events (entities move with collision checks) + get marked for update
+        if COSTS.enabled:
+            [COSTS.call("events", x[3], x[0], *x[1], **x[2]) for x in World.events]
+        else:
+            [x[0](*x[1], **x[2]) for x in World.events]  # execute queued trigger events (entities move with collision checks) + get marked for update
+        World.tick_counts["events"] = len(World.events)
         World.events = list()
-        TIMINGS["t_events"] = time.process_time()
-        [x._update() for x in World.updates]  # execute recursive updates for changed entities + queue render calls
+        TIMINGS["t_events"] = time.perf_counter()
+        if COSTS.enabled:
+            [COSTS.call("updates", x, x._update) for x in World.updates]
+        else:
+            [x._update() for x in World.updates]  # execute recursive updates for changed entities + queue render calls
+        World.tick_counts["updates"] = len(World.updates)
         World.updates = set()
-        TIMINGS["t_updates"] = time.process_time()
-        [x() for x in World.animations]  # queue updates for animations
+        TIMINGS["t_updates"] = time.perf_counter()
+        if World._animations_dirty:
+            World.animations[:] = [x for x in World.animations if x not in World.sleeping_animations]
+            World._animations_dirty = False
+        if COSTS.enabled:
+            [COSTS.call("animations", getattr(x, "__self__", None), x) for x in World.animations]
+        else:
+            [x() for x in World.animations]  # queue updates for animations
+        TIMINGS["t_animations"] = time.perf_counter()
+        if render:
+            World.render_world()
+        World.tick += 1
+        TIMINGS["t_render"] = time.perf_counter()
+    
+    @staticmethod
+    def update_quiescence(activity:int):
+        """Called after a full tick with the World.activity from before the tick"""
+        if World.activity == activity and not World.events and World.animations_idle():
+            World.quiet_ticks += 1
+        else:
+            World.quiet_ticks = 0
+        World.quiet_activity = World.activity
+    
+    @staticmethod
+    def is_quiescent() -> bool:
+        """True if the next tick can't change anything (any activity since the last tick, e.g. the mouse, wakes the world)"""
+        return (World.quiet_ticks >= World.QUIESCENT_TICKS and World.activity == World.quiet_activity and not World.events
+                and not (World.timers and World.timers[0].tick <= World.tick))
+    
+    @staticmethod
+    def sleep_animation(func):
+        """
+        Stops calling func from the next tick on until wake_animation(func) (an actuator at its end position),
+        the owner wakes it on the state change that moves it again. A sleeping animation has to be idle.
+        """
+        World.sleeping_animations.add(func)
+        World._animations_dirty = True
+    
+    @staticmethod
+    def wake_animation(func):
+        if func in World.sleeping_animations:
+            World.sleeping_animations.discard(func)
+            if func not in World.animations:
+                World.animations.append(func)
+    
+    @staticmethod
+    def remove_animation(func):
+        World.sleeping_animations.discard(func)
+        if func in World.animations:
+            World.animations.remove(func)
+    
+    @staticmethod
+    def animations_idle() -> bool:
+        """Sleeping animations are idle, only the awake ones are asked"""
+        for animation in World.animations:
+            owner = getattr(animation, "__self__", None)  # animations are bound methods of their Entity
+            if not isinstance(owner, Entity) or not owner.is_idle():
+                return False
+        return True
+    
+    @staticmethod
+    def render_world():
+        """Executes the queued render calls, only the final state of several ticks gets drawn"""
+        t_start = time.perf_counter()
         [x._render() for x in World.renders]  # execute queued render calls
-        TIMINGS["t_render"] = time.process_time()
+        World.instance.backend.flush()  # send everything that changed on screen
+        METRICS.record_render(time.perf_counter() - t_start, len(World.renders))
         World.renders = set()
-        # clear queues
     
     @property
     def abs_pos(self) -> Vector:
         return self.pos
     
     @staticmethod
-    def enqueue_event(func, args=None, kwargs=None):
+    def enqueue_event(func, args=None, kwargs=None, owner:Entity=None):
+        """owner: the Entity the event is booked on by COSTS (default: the Entity of a bound method)"""
         args = args if args else tuple()
         kwargs = kwargs if kwargs else dict()
-        World.events.append([func, args, kwargs])
+        if isinstance(getattr(func, "__self__", None), Entity):
+            owner = func.__self__
+        World.events.append([func, args, kwargs, owner])
         
+    @staticmethod
+    def schedule_at(tick:int, func, args=None, kwargs=None, owner:Entity=None) -> Timer:
+        """
+        Calls func(*args, **kwargs) in the events phase of the given tick (a tick in the past: the next tick)
+        owner: see enqueue_event
+        """
+        if isinstance(getattr(func, "__self__", None), Entity):
+            owner = func.__self__
+        timer = Timer(tick, next(World._timer_seq), func, args if args else tuple(), kwargs if kwargs else dict(), owner)
+        heapq.heappush(World.timers, timer)
+        return timer
+    
+    @staticmethod
+    def schedule_in(ticks:int, func, args=None, kwargs=None, owner:Entity=None) -> Timer:
+        """schedule_at ticks after the tick that is currently simulated (0: the next tick if called from an event)"""
+        return World.schedule_at(World.tick + ticks, func, args=args, kwargs=kwargs, owner=owner)
+    
+    @staticmethod
+    def next_timer_tick() -> int | None:
+        """The tick of the next pending timer, None if there is none"""
+        timers = World.timers
+        while timers and timers[0].cancelled:
+            heapq.heappop(timers)
+        return timers[0].tick if timers else None
+    
+    @staticmethod
+    def _enqueue_due_timers():
+        timers = World.timers
+        while timers and timers[0].tick <= World.tick:
+            timer = heapq.heappop(timers)
+            if not timer.cancelled:
+                World.events.append([timer.func, timer.args, timer.kwargs, timer.owner])
+    
+    @staticmethod
+    def skip_ticks(ticks:int=1):
+        """Advances the clock over quiescent ticks that are not simulated"""
+        World.tick += ticks
+    
     def save(self) -> dict:
         return {"type": self.__class__.__name__, 
                 "children": [x._to_json() for x in self.children if not x.dont_save]
                 }
+    
+    def _entities(self) -> list[Entity]:
+        """All Entities of the tree, parents before their children"""
+        entities = list()
+        stack = list(reversed(self.children))
+        while stack:
+            entity = stack.pop()
+            entities.append(entity)
+            stack.extend(reversed(entity.children))
+        return entities
+    
+    def snapshot(self) -> "WorldSnapshot":
+        """
+        Captures the dynamic state of the world in memory: the attributes of all Entities and Triggers
+        (positions, parents, animation state, present entities, PLC handshake), the RenderContainer positions
+        and the pending events. Nothing is copied deeper than one container level, see WorldSnapshot.
+        """
+        snapshot = WorldSnapshot()
+        for entity in self._entities():
+            snapshot.entities[entity] = WorldSnapshot.capture(entity, entity.snapshot_exclude)
+            snapshot.renders.extend([(x, x.pos) for x in entity.renders])
+        for trigger in Trigger.instances:
+            snapshot.triggers[trigger] = WorldSnapshot.capture(trigger)
+        snapshot.lists = [(x, list(x)) for x in (self.children, World.animations, Trigger.instances, *World.layers)]
+        snapshot.events = [list(x) for x in World.events]
+        snapshot.updates = set(World.updates)
+        snapshot.tick_counts = dict(World.tick_counts)
+        snapshot.tick = World.tick
+        snapshot.sleeping_animations = set(World.sleeping_animations)
+        snapshot.timers = [(x, x.cancelled) for x in World.timers]
+        return snapshot
+    
+    def restore(self, snapshot:"WorldSnapshot"):
+        """
+        Rewinds the world to a snapshot without rebuilding canvas items or OPC servers
+        Entities created since the snapshot are removed, removed ones come back with new RenderContainers,
+        colliders and triggers (_init_render_containers, e.g. Stacks)
+        """
+        current = self._entities()
+        for entity in current:
+            if entity not in snapshot.entities and entity in entity.parent.children:  # not removed with its parent
+                entity.remove()
+        current = set(current)
+        revived = [x for x in snapshot.entities if x not in current]
+        
+        for entity, state in snapshot.entities.items():
+            WorldSnapshot.apply(entity, state)
+        for trigger, state in snapshot.triggers.items():
+            WorldSnapshot.apply(trigger, state)
+        for container, items in snapshot.lists:
+            container[:] = items
+        World.events = [list(x) for x in snapshot.events]
+        World.updates = set(snapshot.updates)
+        World.tick_counts = dict(snapshot.tick_counts)
+        World.tick = snapshot.tick
+        World.sleeping_animations = set(snapshot.sleeping_animations)
+        World._animations_dirty = True
+        for timer, cancelled in snapshot.timers:
+            timer.cancelled = cancelled
+        World.timers[:] = [x for x, _ in snapshot.timers]  # a copy of a heap is a heap
+        for rc, pos in snapshot.renders:
+            if rc.parent is not None:
+                rc.pos = pos
+        
+        self._restored(revived)
+    
+    def _restored(self, revived:list=()):
+        """
+        Rebuilds the derived state after the attributes got set back (World.restore, Autosave.restore): absolute
+        positions, the RenderContainers, colliders and triggers of revived Entities and the grid
+        """
+        entities = self._entities()
+        for entity in entities:
+            entity._abs_dirty = False
+        [x._invalidate_abs_pos() for x in self.children]
+        
+        for entity in revived:
+            old_triggers = {id(x) for x in entity.triggers}
+            Trigger.instances[:] = [x for x in Trigger.instances if id(x) not in old_triggers]
+            entity.renders, entity.colliders, entity.triggers = list(), list(), list()
+            if hasattr(entity, "_init_render_containers"):
+                entity._init_render_containers()
+        
+        World.grid.clear()
+        for layer in World.layers:
+            [World.grid.update(x) for x in layer]
+        [x._after_restore() for x in entities]
+        World.activity += 1
+        World.quiet_ticks = 0
 
     def load(self, save_data) -> None:
         def recursive_load(self, save_data):
@@ -1,77 +1,263 @@
 from tkinter import ttk, Tk
 import tkinter as tk
-from asyncua.sync import Client, ThreadLoop
-from asyncua import ua
+import asyncio
+import os
+import random
+import sys
+import time
+from asyncua import Client, ua
+from asyncua.sync import ThreadLoop
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "DigitalTwin"))
+from digitalTwin_Metrics import percentile
 
-def ua_setter(var, val):
-    var.set_value(ua.DataValue(ua.Variant(val, var.get_data_type_as_variant_type())))
+
+ENDPOINTS = {"Module1": "opc.tcp://localhost:7000",
+             "Module2": "opc.tcp://localhost:7001",
+             "Module3a": "opc.tcp://localhost:7002",
+             "Module3b": "opc.tcp://localhost:7003"}
+# names of the modules in the twin, a twin started with --shared-opc hosts each in the namespace "PLC_OPC/<name>"
+MODULE_NAMES = {"Module1": "Module 1",
+                "Module2": "Module 2",
+                "Module3a": "Module 3a",
+                "Module3b": "Module 3b"}
+
+# colour and stopper orders of the buttons below
+ORDER_MIX = {"Module1": (1, 2, 3, 4),
+             "Module2": (1, 2, 3, 4),
+             "Module3a": (1, 2, 3, 4, 5, 6, 7, 8, 9),
+             "Module3b": (1, 2, 3)}
 
 
 class PLC_OPCua:
+    """
+    ERP side of the Start/Ack/Busy handshake of one module
+    Ack, Busy, Ready and Msg are subscribed, the state machine advances in the data change notifications
+    (no polling). The variant types of Start and Order are read once, both are written in one request.
+    
+    The namespace index of the tags is looked up on connect: "PLC_OPC" on a server per module,
+    "PLC_OPC/<name>" on the shared server of a twin started with --shared-opc (see module_address).
+    
+    verbose: print the state changes
+    
+    Runs in any asyncio loop, many modules can share one loop (and one thread):
+        plc = PLC_OPCua("opc.tcp://localhost:7000")
+        await plc.connect()
+        plc.place_order(1)  # thread safe
+    """
     instances:list["PLC_OPCua"] = list()
-    TLOOP = None
+    TLOOP = None  # ThreadLoop of the GUI
+    PUBLISHING_INTERVAL = 10  # ms
+    SHARED_ENDPOINT:str = None  # endpoint of a twin started with --shared-opc, see module_address
     
-    def __init__(self, url:str="opc.tcp://localhost:7000"):
-        if not PLC_OPCua.TLOOP:
-            PLC_OPCua.TLOOP = ThreadLoop()
-            PLC_OPCua.TLOOP.start()
-        self._client = Client(tloop=PLC_OPCua.TLOOP, url=url)
+    def __init__(self, url:str="opc.tcp://localhost:7000", namespace:str="PLC_OPC", verbose:bool=True):
+        self._client = Client(url=url)
         self._url = url
-        self._client.connect()
-        self._start = self._client.get_node(nodeid='ns=2;s="Start"')
-        self._acknowledge = self._client.get_node(nodeid='ns=2;s="Ack"')
-        self._busy = self._client.get_node(nodeid='ns=2;s="Busy"')
-        self._ready = self._client.get_node(nodeid='ns=2;s="Ready"')
-        
-        self._order = self._client.get_node(nodeid='ns=2;s="Order"')
-        self._msg = self._client.get_node(nodeid='ns=2;s="Msg"')
+        self._namespace:str = namespace
+        self.verbose:bool = verbose
+        self._loop:asyncio.AbstractEventLoop = None
         
         self._state = 0
         self.__order = 0
         self.msg = 0
+        self.ack = False
+        self.busy = False
+        self.ready = False
+        
+        self._done:asyncio.Future = None  # of run_order
+        self._t_ack:float = None
         
         self.instances.append(self)
+    
+    async def connect(self):
+        self._loop = asyncio.get_running_loop()
+        await self._client.connect()
+        ns = await self._client.get_namespace_index(self._namespace)
+        self._start = self._client.get_node(nodeid=f'ns={ns};s="Start"')
+        self._acknowledge = self._client.get_node(nodeid=f'ns={ns};s="Ack"')
+        self._busy = self._client.get_node(nodeid=f'ns={ns};s="Busy"')
+        self._ready = self._client.get_node(nodeid=f'ns={ns};s="Ready"')
+        
+        self._order = self._client.get_node(nodeid=f'ns={ns};s="Order"')
+        self._msg = self._client.get_node(nodeid=f'ns={ns};s="Msg"')
         
+        self._variant_types = {x.nodeid: await x.read_data_type_as_variant_type() for x in (self._start, self._order)}
+        self._keys = {self._acknowledge.nodeid: "ack", self._busy.nodeid: "busy", self._ready.nodeid: "ready", self._msg.nodeid: "msg"}
+        self._subscription = await self._client.create_subscription(self.PUBLISHING_INTERVAL, self)
+        # queue every change, a short Ack pulse must not be merged away within one publishing interval
+        await self._subscription.subscribe_data_change([self._acknowledge, self._busy, self._ready, self._msg], queuesize=10)
+    
+    async def disconnect(self):
+        await self._subscription.delete()
+        await self._client.disconnect()
+        self.instances.remove(self)
+    
+    async def datachange_notification(self, node, val, data):
+        setattr(self, self._keys[node.nodeid], val)
+        await self._advance()
+    
+    def status_change_notification(self, status):
+        print(self._url, "Subscription status:", status.Status)
+    
     @property
     def order(self):
         return self.__order
         
     @order.setter
     def order(self, value:int):
+        self.place_order(value)
+    
+    def place_order(self, order):
+        """Ignored while an order is handled, callable from any thread"""
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._place_order(order)))
+    
+    async def run_order(self, order:int) -> float:
+        """Places order and waits until Busy is cleared, returns the perf_counter time of the Ack (None if an order is running)"""
+        if self._state:
+            return None
+        self._done = self._loop.create_future()
+        await self._place_order(order)
+        return await self._done
+    
+    async def reset(self):
+        """Gives up the running order (order 11 resets the handshake of the module)"""
+        self._set_state(0)
+        await self._write((self._order, 11), (self._start, False))
+    
+    async def _place_order(self, order):
         if self._state:
             return
-        self.__order = value
+        self.__order = order
         self._set_state(1)
-        
-    def update_state(self):
-        self.msg = self._msg.get_value()
-        
-        if self._state == 1 and self._ready.get_value():
-            ua_setter(self._order, self.__order)
-            ua_setter(self._start, True)
-            if self._acknowledge.get_value():
-                self._set_state(2)
-        if self._state == 2:
-            ua_setter(self._start, False)
-            if not self._acknowledge.get_value():
-                self._set_state(3)
-        if self._state == 3:
-            if not self._busy.get_value():
-                self._set_state(0)
+        await self._advance()
+    
+    async def _advance(self):
+        if self._state == 1 and self.ready:
+            self._set_state(2)
+            await self._write((self._order, self.__order), (self._start, True))
+        if self._state == 2 and self.ack:
+            self._set_state(3)
+            await self._write((self._start, False))
+        if self._state == 3 and not self.ack:
+            self._set_state(4)
+        if self._state == 4 and not self.busy:
+            self._set_state(0)
+    
+    async def _write(self, *values):
+        nodes = [x[0] for x in values]
+        await self._client.write_values(nodes, [ua.DataValue(ua.Variant(v, self._variant_types[n.nodeid])) for n, v in values])
     
     def _set_state(self, state):
-        print(self._url, "State set to:", state)
+        if self.verbose:
+            print(self._url, "State set to:", state)
         self._state = state
+        if state == 3:
+            self._t_ack = time.perf_counter()
+        elif state == 0 and self._done is not None:
+            if not self._done.done():
+                self._done.set_result(self._t_ack)
+            self._done = None
+
+
+def module_address(module:str) -> tuple[str, str]:
+    """(url, namespace) of a module of ENDPOINTS, on the shared endpoint if PLC_OPCua.SHARED_ENDPOINT is set"""
+    if PLC_OPCua.SHARED_ENDPOINT:
+        return PLC_OPCua.SHARED_ENDPOINT, f"PLC_OPC/{MODULE_NAMES[module]}"
+    return ENDPOINTS[module], "PLC_OPC"
+
+
+class LoadGenerator:
+    """
+    Headless capacity test of the twin: fires random orders of the mix at the modules and measures
+    the time from place_order via Ack to Busy cleared, waiting for a busy module included.
     
-    def place_order(self, order):
-        self.order = order
+    rate: orders/s per module with Poisson arrivals (open loop),
+    otherwise concurrency clients per module that place the next order when the last one is done (closed loop)
+    endpoints: (url, namespace) per module, default is module_address (PLC_OPCua.SHARED_ENDPOINT included)
+    
+        stats = asyncio.run(LoadGenerator(rate=0.5).run(60))
+    """
+    def __init__(self, mix:dict[str, tuple]=ORDER_MIX, endpoints:dict[str, tuple[str, str]]=None, rate:float=None, 
+                 concurrency:int=1, timeout:float=30.0, seed:int=None):
+        self.mix:dict[str, tuple] = mix
+        self.endpoints:dict[str, tuple[str, str]] = endpoints if endpoints else {x: module_address(x) for x in mix}
+        self.rate:float = rate
+        self.concurrency:int = concurrency
+        self.timeout:float = timeout  # per order, a timed out order resets the handshake
+        self._random = random.Random(seed)
+        self._records:dict[str, list] = {x: list() for x in mix}  # (order, t_placed, t_start, t_ack, t_done)
+        self._timeouts:dict[str, int] = {x: 0 for x in mix}
+    
+    async def run(self, duration:float) -> dict:
+        """Places orders for duration seconds, waits for the orders in flight and returns the stats"""
+        plcs = {x: PLC_OPCua(*self.endpoints[x], verbose=False) for x in self.mix}
+        await asyncio.gather(*[x.connect() for x in plcs.values()])
+        queues = {x: asyncio.Queue() for x in self.mix}
+        workers = [asyncio.create_task(self._serve(name, plcs[name], queues[name])) for name in self.mix]
+        if self.rate:
+            sources = [asyncio.create_task(self._open_loop(name, queues[name])) for name in self.mix]
+        else:
+            sources = [asyncio.create_task(self._closed_loop(name, queues[name])) 
+                       for name in self.mix for _ in range(self.concurrency)]
+        
+        t_start = time.perf_counter()
+        await asyncio.sleep(duration)
+        [x.cancel() for x in sources]
+        try:  # the orders in flight
+            await asyncio.wait_for(asyncio.gather(*[x.join() for x in queues.values()]), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - t_start
+        [x.cancel() for x in workers]
+        await asyncio.gather(*[x.disconnect() for x in plcs.values()])
+        return self.stats(elapsed)
+    
+    async def _serve(self, name:str, plc:PLC_OPCua, queue:asyncio.Queue):
+        while True:
+            order, t_placed, future = await queue.get()
+            t_start = time.perf_counter()
+            try:
+                t_ack = await asyncio.wait_for(plc.run_order(order), self.timeout)
+                self._records[name].append((order, t_placed, t_start, t_ack, time.perf_counter()))
+            except asyncio.TimeoutError:
+                self._timeouts[name] += 1
+                await plc.reset()
+            finally:
+                queue.task_done()
+                if future is not None and not future.done():
+                    future.set_result(None)
+    
+    async def _open_loop(self, name:str, queue:asyncio.Queue):
+        t_next = time.perf_counter()
+        while True:
+            queue.put_nowait((self._random.choice(self.mix[name]), time.perf_counter(), None))
+            t_next += self._random.expovariate(self.rate)
+            await asyncio.sleep(max(t_next - time.perf_counter(), 0))
+    
+    async def _closed_loop(self, name:str, queue:asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.create_future()
+            queue.put_nowait((self._random.choice(self.mix[name]), time.perf_counter(), future))
+            await future
+    
+    def stats(self, elapsed:float) -> dict:
+        """Throughput (orders/s) and latency percentiles (seconds) per module"""
+        result = dict()
+        for name, records in self._records.items():
+            latency = {"ack": [x[3] - x[1] for x in records],
+                       "done": [x[4] - x[1] for x in records],
+                       "service": [x[4] - x[2] for x in records]}  # without the wait for a busy module
+            result[name] = {"orders": len(records), "timeouts": self._timeouts[name], "throughput": len(records) / elapsed,
+                            "latency": {k: {"p50": percentile(v, 50), "p95": percentile(v, 95), "p99": percentile(v, 99), 
+                                            "max": max(v, default=None)} for k, v in latency.items()}}
+        return result
 
 
 class Module1(ttk.Frame, PLC_OPCua):
     def __init__(self, master, *args, **kwargs):
         ttk.Frame.__init__(self, master=master, *args, **kwargs)
-        PLC_OPCua.__init__(self, url="opc.tcp://localhost:7000")
+        PLC_OPCua.__init__(self, *module_address("Module1"))
         
         self.__init_widgets__()
     
@@ -85,7 +271,7 @@ class Module1(ttk.Frame, PLC_OPCua):
 class Module2(ttk.Frame, PLC_OPCua):
     def __init__(self, master, *args, **kwargs):
         ttk.Frame.__init__(self, master=master, *args, **kwargs)
-        PLC_OPCua.__init__(self, url="opc.tcp://localhost:7001")
+        PLC_OPCua.__init__(self, *module_address("Module2"))
         
         self.__init_widgets__()
         
@@ -99,7 +285,7 @@ class Module2(ttk.Frame, PLC_OPCua):
 class Module3a(ttk.Frame, PLC_OPCua):
     def __init__(self, master, *args, **kwargs):
         ttk.Frame.__init__(self, master=master, *args, **kwargs)
-        PLC_OPCua.__init__(self, url="opc.tcp://localhost:7002")
+        PLC_OPCua.__init__(self, *module_address("Module3a"))
         
         self.__init_widgets__()
         
@@ -121,7 +307,7 @@ class Module3a(ttk.Frame, PLC_OPCua):
 class Module3b(ttk.Frame, PLC_OPCua):
     def __init__(self, master, *args, **kwargs):
         ttk.Frame.__init__(self, master=master, *args, **kwargs)
-        PLC_OPCua.__init__(self, url="opc.tcp://localhost:7003")
+        PLC_OPCua.__init__(self, *module_address("Module3b"))
         
         self.__init_widgets__()
         
@@ -131,21 +317,58 @@ class Module3b(ttk.Frame, PLC_OPCua):
         tk.Button(self, text="Order Black", command=lambda: self.place_order(3)).grid(row=2, column=0)
 
 
+def _parse_mix(text:str) -> tuple[str, tuple]:
+    name, orders = text.split("=")
+    return name, tuple(int(x) for x in orders.split(","))
+
+
 if __name__ == "__main__":
+    import argparse
+    import json
+    
+    parser = argparse.ArgumentParser(description="ERP for the Module 1 - Module 3b plant, with --load a headless load generator")
+    parser.add_argument("--load", action="store_true", help="fire orders at the modules instead of opening the GUI")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of placing orders")
+    parser.add_argument("--rate", type=float, help="orders/s per module (open loop), default is closed loop")
+    parser.add_argument("--concurrency", type=int, default=1, help="clients per module in the closed loop")
+    parser.add_argument("--mix", type=_parse_mix, action="append", metavar="MODULE=ORDERS", 
+                        help="e.g. Module1=3,4 (repeatable), default are all orders of all modules")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds until an order is given up")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", metavar="PATH", help="write the stats to PATH")
+    parser.add_argument("--shared-opc", metavar="ENDPOINT", help="endpoint of a twin started with --shared-opc, e.g. opc.tcp://localhost:4840")
+    args = parser.parse_args()
+    PLC_OPCua.SHARED_ENDPOINT = args.shared_opc
+    
+    if args.load:
+        generator = LoadGenerator(mix=dict(args.mix) if args.mix else ORDER_MIX, rate=args.rate, 
+                                  concurrency=args.concurrency, timeout=args.timeout, seed=args.seed)
+        stats = asyncio.run(generator.run(args.duration))
+        for name, s in stats.items():
+            done = s["latency"]["done"]
+            print(f"{name:<9} {s['orders']:6} orders {s['throughput']:7.2f}/s {s['timeouts']:4} timeouts", 
+                  *[f"{k} {done[k]*1000:8.1f}ms" if done[k] is not None else f"{k}        -" for k in ("p50", "p95", "p99")])
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(stats, f, indent=4)
+        raise SystemExit
+    
     root = Tk()
     root.rowconfigure(0, weight=1)
     root.columnconfigure(0, weight=1)
     
+    PLC_OPCua.TLOOP = ThreadLoop()  # all clients share one asyncio loop next to the Tk mainloop
+    PLC_OPCua.TLOOP.start()
+    
     Module1(master=root).grid(row=0, column=0, sticky="NSEW")
     Module2(master=root).grid(row=0, column=1, sticky="NSEW")
     Module3a(master=root).grid(row=0, column=2, sticky="NSEW")
     Module3b(master=root).grid(row=0, column=3, sticky="NSEW")
     
-    def update_opc():
-        for x in PLC_OPCua.instances:
-            x.update_state()
-        root.after(100, update_opc)
-        
-    update_opc()
+    for x in list(PLC_OPCua.instances):
+        PLC_OPCua.TLOOP.post(x.connect())
     root.mainloop()
-    
\ No newline at end of file
+    
+    for x in list(PLC_OPCua.instances):
+        PLC_OPCua.TLOOP.post(x.disconnect())
+    PLC_OPCua.TLOOP.stop()
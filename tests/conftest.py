@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the modules import each other by their flat names (python digitalTwin.py from within DigitalTwin)
+sys.path[:0] = [os.path.join(ROOT, "DigitalTwin"), os.path.join(ROOT, "Tools")]
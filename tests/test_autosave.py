@@ -0,0 +1,98 @@
+import pytest
+
+from digitalTwin_base import World
+from digitalTwin_Entities import PLC_OPCua, Stack, Stopper, Picker
+from digitalTwin_Headless import HeadlessSimulation
+from digitalTwin_SaveFile import Autosave, BinarySaveReader
+from digitalTwin import create_plant
+
+
+ORDERS = {5: ("Module 1", 1), 40: ("Module 2", 1), 60: ("Module 3a", 1), 70: ("Module 3b", 2)}
+
+
+@pytest.fixture
+def plant(monkeypatch):
+    monkeypatch.setattr(PLC_OPCua, "ENABLED", False)
+    sims = list()
+    
+    def build() -> tuple[HeadlessSimulation, dict]:
+        sim = HeadlessSimulation()
+        sims.append(sim)
+        plcs = {x.name: x for x in create_plant(sim.world)}
+        for plc in plcs.values():
+            plc.status.ready = True
+        return sim, plcs
+    yield build
+    for sim in sims:
+        sim.clear()
+
+
+def run(sim:HeadlessSimulation, plcs:dict, ticks:int, on_tick=None):
+    for _ in range(ticks):
+        tick = World.tick
+        if tick in ORDERS:
+            name, order = ORDERS[tick]
+            plcs[name].status.set_input("order", order)
+            plcs[name].status.set_input("start", True)
+        elif tick - 5 in ORDERS:
+            plcs[ORDERS[tick - 5][0]].status.set_input("start", False)
+        sim.step()
+        if on_tick:
+            on_tick(World.tick)
+
+
+def plant_state(world:World) -> list[tuple]:
+    state = list()
+    for entity in world._entities():
+        row = [type(entity).__name__, type(entity.parent).__name__, entity.abs_pos, entity.layer]
+        if isinstance(entity, Stack):
+            row += [list(entity.stack)]
+        elif isinstance(entity, Stopper):
+            row += [entity.collisions_enabled, entity._close_requested]
+        elif isinstance(entity, Picker):
+            row += [entity.sled_actual_pos, entity.sled_target_pos, entity.sled_in_pos, entity.sled_occupied]
+        elif hasattr(entity, "status"):
+            row += [entity.status._state, entity.status.ack, entity.status.busy, entity.status.order]
+        state.append(row)
+    return state
+
+
+def test_restore_matches_the_live_plant(plant, tmp_path):
+    sim, plcs = plant()
+    autosave = Autosave(sim.world, tmp_path, interval=1e9)
+    run(sim, plcs, 300, on_tick=lambda tick: tick in (150, 300) and autosave.checkpoint())
+    autosave.stop()
+    live, tick = plant_state(sim.world), World.tick
+    assert any([x.sled_occupied for x in sim.world._entities() if isinstance(x, Picker)])  # a Stack in flight
+    
+    first, last = sorted(tmp_path.iterdir())
+    with open(first, "rb") as f:
+        _, _, nodes, _, _ = BinarySaveReader(f).read_checkpoint()
+    assert {x[1] for x in nodes.values()} == {Stack}  # the modules are part of the layout, not runtime Entities
+    with open(last, "rb") as f:
+        _, base, nodes, states, _ = BinarySaveReader(f).read_checkpoint()
+    assert base == 1 and states  # the delta holds the changed runtime state
+    
+    run(sim, plcs, 200)
+    live_later = plant_state(sim.world)
+    sim.clear()
+    
+    restored, plcs = plant()
+    assert Autosave.restore(restored.world, tmp_path) == 2
+    assert World.tick == tick
+    assert plant_state(restored.world) == live
+    run(restored, plcs, 200)
+    assert plant_state(restored.world) == live_later
+
+
+def test_restore_needs_the_same_layout(plant, tmp_path):
+    sim, plcs = plant()
+    autosave = Autosave(sim.world, tmp_path, interval=1e9)
+    autosave.checkpoint()
+    autosave.stop()
+    sim.clear()
+    
+    sim, plcs = plant()
+    plcs["Module 1"].remove()
+    with pytest.raises(ValueError):
+        Autosave.restore(sim.world, tmp_path)
@@ -0,0 +1,24 @@
+import pytest
+
+from digitalTwin_base import World, Vector, Orientation
+from digitalTwin_Entities import PLC_OPCua, Conveyer, Remover, Stack
+from digitalTwin_Headless import HeadlessSimulation
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    monkeypatch.setattr(PLC_OPCua, "ENABLED", False)
+    sim = HeadlessSimulation()
+    yield sim
+    sim.clear()
+
+
+@pytest.mark.parametrize("lane", [False, True])
+def test_remover_before_conveyer(sim, lane):
+    # the Remover's trigger removes the Stack before the belt moves it in the same tick
+    Remover(sim.world, pos=Vector(100, 0), size=Vector(20, 20))
+    Conveyer(sim.world, pos=Vector(0, 10), length=200, speed=1, orientation=Orientation.EAST, lane=lane)
+    stack = Stack(sim.world, pos=Vector(80, 10))
+    sim.run(40)
+    assert not stack.colliders
+    assert stack not in World.layers[0]
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import digitalTwin_Async_opc as twin
+import ERP
+
+
+SHARED_ENDPOINT = "opc.tcp://localhost:48401"
+
+
+@pytest.fixture
+def shared_modules(monkeypatch):
+    """Module 1 and Module 2 on one shared server, a background PLC cycle finishes every order right after its Ack"""
+    monkeypatch.setattr(twin.PLC_OPCua, "SHARED_ENDPOINT", SHARED_ENDPOINT)
+    modules = {x: twin.PLC_OPCua(name=x) for x in ("Module 1", "Module 2")}
+    orders = {x: list() for x in modules}
+    for module in modules.values():
+        module.ready = True
+    stop = threading.Event()
+    
+    def cycle():
+        while not stop.is_set():
+            for name, module in modules.items():
+                module.update_opc()
+                if module._state == 1:
+                    orders[name].append(module.order)
+                if module._state == 2:
+                    module.busy = False
+            twin.PLC_OPCua.flush_outputs()
+            time.sleep(0.005)
+    thread = threading.Thread(target=cycle)
+    thread.start()
+    yield orders
+    stop.set()
+    thread.join()
+    [x.remove() for x in modules.values()]
+
+
+def test_module_address(monkeypatch):
+    assert ERP.module_address("Module3a") == (ERP.ENDPOINTS["Module3a"], "PLC_OPC")
+    monkeypatch.setattr(ERP.PLC_OPCua, "SHARED_ENDPOINT", SHARED_ENDPOINT)
+    assert ERP.module_address("Module3a") == (SHARED_ENDPOINT, "PLC_OPC/Module 3a")
+
+
+def test_order_on_shared_endpoint(shared_modules, monkeypatch):
+    monkeypatch.setattr(ERP.PLC_OPCua, "SHARED_ENDPOINT", SHARED_ENDPOINT)
+    
+    async def run_order():
+        plc = ERP.PLC_OPCua(*ERP.module_address("Module2"), verbose=False)
+        await plc.connect()
+        try:
+            return await asyncio.wait_for(plc.run_order(3), 10)
+        finally:
+            await plc.disconnect()
+    
+    assert asyncio.run(run_order()) is not None  # the Ack arrived
+    assert shared_modules["Module 2"][:1] == [3]
+    assert shared_modules["Module 1"] == []
+
+
+def test_load_generator_on_shared_endpoint(shared_modules, monkeypatch):
+    monkeypatch.setattr(ERP.PLC_OPCua, "SHARED_ENDPOINT", SHARED_ENDPOINT)
+    generator = ERP.LoadGenerator(mix={"Module1": (1, 2)}, timeout=5, seed=1)
+    assert generator.endpoints == {"Module1": (SHARED_ENDPOINT, "PLC_OPC/Module 1")}
+    
+    gui = ERP.PLC_OPCua(*ERP.module_address("Module1"))
+    stats = asyncio.run(generator.run(0.5))
+    assert gui.verbose  # the generator's clients are quiet, other clients keep printing
+    assert stats["Module1"]["orders"] > 0
+    assert stats["Module1"]["timeouts"] == 0
+    assert set(shared_modules["Module 1"]) <= {1, 2}
+    assert shared_modules["Module 2"] == []
@@ -0,0 +1,73 @@
+from collections import Counter
+import json
+
+import pytest
+
+from digitalTwin_base import Vector, Orientation
+from digitalTwin_Entities import PLC_OPCua, PLC, Conveyer, Remover, Stopper, Wall
+from digitalTwin_Headless import HeadlessSimulation
+from digitalTwin_SaveFile import save_binary, load_binary
+from digitalTwin_Simulation import SaveFileEncoder
+from digitalTwin import create_plant
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    monkeypatch.setattr(PLC_OPCua, "ENABLED", False)
+    sims = list()
+    
+    def build() -> HeadlessSimulation:
+        sim = HeadlessSimulation()
+        sims.append(sim)
+        return sim
+    yield build
+    for sim in sims:
+        sim.clear()
+
+
+def entity_count(sim:HeadlessSimulation) -> Counter:
+    return Counter([type(x).__name__ for x in sim.world._entities()])
+
+
+def save_json(world, path):  # like Simulation.save / Simulation.load
+    with open(path, "w") as f:
+        f.write(json.dumps(world.save(), cls=SaveFileEncoder))
+
+
+def load_json(world, path):
+    with open(path) as f:
+        world.load(json.loads(f.read()))
+
+
+@pytest.mark.parametrize("save, load, suffix", [(save_binary, load_binary, ".dtb"), (save_json, load_json, ".json")])
+def test_plant_round_trip(sim, tmp_path, save, load, suffix):
+    plant = sim()
+    create_plant(plant.world)
+    expected = entity_count(plant)
+    path = tmp_path / f"plant{suffix}"
+    save(plant.world, path)
+    plant.clear()
+    
+    loaded = sim()
+    load(loaded.world, path)
+    assert entity_count(loaded) == expected  # the PLCs build their modules again, nothing is saved twice
+    assert sorted([x.name for x in PLC.instances]) == ["Module 1", "Module 2", "Module 3a", "Module 3b"]
+
+
+@pytest.mark.parametrize("save, load, suffix", [(save_binary, load_binary, ".dtb"), (save_json, load_json, ".json")])
+def test_layout_round_trip(sim, tmp_path, save, load, suffix):
+    layout = sim()
+    Conveyer(layout.world, pos=Vector(0, 10), length=200, speed=1, orientation=Orientation.EAST)
+    Stopper(layout.world, pos=Vector(100, 0), orientation=Orientation.SOUTH)
+    Wall(layout.world, pos=Vector(0, 40), size=Vector(200, 5))
+    Remover(layout.world, pos=Vector(200, 0), size=Vector(20, 20))
+    expected = entity_count(layout)
+    path = tmp_path / f"layout{suffix}"
+    save(layout.world, path)
+    layout.clear()
+    
+    loaded = sim()
+    load(loaded.world, path)  # JSON has [x, y] lists for the Vectors
+    assert entity_count(loaded) == expected
+    remover = [x for x in loaded.world.children if isinstance(x, Remover)][0]
+    assert remover.size == Vector(20, 20)
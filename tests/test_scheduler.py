@@ -0,0 +1,68 @@
+import pytest
+
+from digitalTwin_base import World
+from digitalTwin_Entities import PLC_OPCua
+from digitalTwin_Headless import HeadlessSimulation
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(PLC_OPCua, "ENABLED", False)
+    calls = list()
+    yield calls
+    World.timers.clear()
+
+
+def record(calls:list, name:str):
+    return lambda: calls.append((name, World.tick))
+
+
+def test_schedule_at_and_in(calls):
+    sim = HeadlessSimulation()
+    World.schedule_at(5, record(calls, "at 5"))
+    World.schedule_in(3, record(calls, "in 3"))
+    World.schedule_at(5, record(calls, "at 5 again"))  # same tick: in scheduling order
+    sim.run(10)
+    assert calls == [("in 3", 3), ("at 5", 5), ("at 5 again", 5)]
+    assert World.tick == 10 and not World.timers
+
+
+def test_schedule_in_the_past_runs_next_tick(calls):
+    sim = HeadlessSimulation()
+    sim.run(4)
+    World.schedule_at(1, record(calls, "late"))
+    sim.run(2)
+    assert calls == [("late", 4)]
+
+
+def test_cancel(calls):
+    sim = HeadlessSimulation()
+    timer = World.schedule_in(5, record(calls, "cancelled"))
+    World.schedule_in(8, record(calls, "kept"))
+    sim.run(2)
+    timer.cancel()
+    assert World.next_timer_tick() == 8  # the cancelled Timer is dropped from the heap
+    sim.run(10)
+    assert calls == [("kept", 8)]
+
+
+def test_chained_timers(calls):
+    sim = HeadlessSimulation()
+    
+    def chain(left:int):
+        calls.append(("chain", World.tick))
+        if left:
+            World.schedule_in(4, chain, args=(left - 1,))
+    World.schedule_at(2, chain, args=(2,))
+    sim.run(20)
+    assert calls == [("chain", 2), ("chain", 6), ("chain", 10)]
+
+
+def test_headless_run_jumps_to_the_next_timer(calls):
+    sim = HeadlessSimulation(skip_idle=True)
+    World.schedule_at(500, record(calls, "timer"))
+    World.schedule_at(800, record(calls, "cancelled")).cancel()
+    sim.run(1000)
+    assert calls == [("timer", 500)]
+    assert sim.ticks == World.tick == 1000
+    assert sim.skipped_ticks > 990  # only the ticks before the world got quiescent and the timer tick run
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from digitalTwin_base import Vector, Orientation
+from digitalTwin_Entities import PLC_OPCua, Conveyer, Wall, Stack
+from digitalTwin_Headless import HeadlessSimulation
+from digitalTwin_SaveFile import save_binary
+from digitalTwin_Simulation import SaveFileEncoder
+from digitalTwin_Sweep import JamDetector, JAM_TICKS, run_scenario
+from digitalTwin import create_plant
+
+
+SCENARIO = {"ticks": 600, "orders": [[5, "Module 1", 1], [40, "Module 2", 1], [60, "Module 3b", 2]]}
+KPIS = ("ticks", "orders_placed", "orders_completed", "orders_open", "completed_per_module", "order_ticks_p50", "jams", "stacks")
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    monkeypatch.setattr(PLC_OPCua, "ENABLED", False)
+    sim = HeadlessSimulation()
+    yield sim
+    sim.clear()
+
+
+@pytest.mark.parametrize("suffix", [".dtb", ".json"])
+def test_saved_plant_layout(sim, tmp_path, suffix):
+    create_plant(sim.world)
+    path = tmp_path / f"plant{suffix}"
+    if suffix == ".dtb":
+        save_binary(sim.world, path)
+    else:
+        with open(path, "w") as f:
+            f.write(json.dumps(sim.world.save(), cls=SaveFileEncoder))
+    sim.clear()
+    
+    expected = run_scenario({**SCENARIO, "layout": "plant"})
+    result = run_scenario({**SCENARIO, "layout": str(path)})
+    assert expected["orders_completed"]
+    assert {k: result[k] for k in KPIS} == {k: expected[k] for k in KPIS}
+
+
+@pytest.mark.parametrize("stacks, jams", [(1, 0), (2, 1)])
+def test_jam_needs_a_waiting_follower(sim, stacks, jams):
+    # a belt that runs into a Wall: one parked Stack is no jam, the first of a queue is
+    conveyer = Conveyer(sim.world, pos=Vector(0, 10), length=200, speed=1, orientation=Orientation.EAST)
+    Wall(sim.world, pos=Vector(150, 0), size=Vector(10, 20))
+    for i in range(stacks):
+        Stack(sim.world, pos=Vector(100 - 25 * i, 10))
+    detector = JamDetector([conveyer])
+    for _ in range(JAM_TICKS + 100):
+        sim.step()
+        detector.update()
+    assert detector.jams == jams